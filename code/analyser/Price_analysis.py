@@ -25,13 +25,34 @@ File containing calculateur price
 __authors__ = "Anthony Gugler, Florian Hofmann, Jérémy Jordan"
 __date__ = "26.05.2023"
 import json
-import fractions
-import re
+
+from dataprocessing.catalogue import ingredient_index, item_prices, load_items
+from dataprocessing.quantity import quantity_kg
 
 class RecipeCostCalculator:
     def __init__(self, recipe_file, ingredient_file):
         self.recipe_file = recipe_file
         self.ingredient_file = ingredient_file
+        self.__items = None
+        self.__index = None
+
+    def get_items(self):
+        """
+        Load the items once, from the columnar catalogue when it is up to date
+        :return: PriceCatalogue or list of the items
+        """
+        if self.__items is None:
+            self.__items = load_items(self.ingredient_file)
+        return self.__items
+
+    def get_index(self):
+        """
+        Build once the index from (ingredient name, source) to the item chosen for it
+        :return: dict from (ingredient name, source) to the position of the item
+        """
+        if self.__index is None:
+            self.__index = ingredient_index(self.get_items())
+        return self.__index
 
     def get_recipe(self, index):
         with open(self.recipe_file, 'r', encoding='utf-8') as f:
@@ -41,68 +62,48 @@ class RecipeCostCalculator:
             return recipe
 
     def parse_quantity(self, quantity_str):
-        quantity_str = quantity_str.replace('l', '').strip()  
-        # Remove non-numeric parts of the string
-        quantity_str = re.sub("[^\d\/\.]", "", quantity_str)
-        
-        if ',' in quantity_str:  # decimal quantities
-            quantity = float(quantity_str.replace(',', '.'))
-        elif '%' in quantity_str:  # percentage quantities
-            quantity = float(quantity_str.replace('%', ''))*0.01
-        elif 'cl' in quantity_str:  # centiliter quantities
-            quantity = float(quantity_str.replace('cl', ''))*0.01
-        elif 'g' in quantity_str:  # gram quantities
-            quantity = float(quantity_str.replace('g', ''))*0.001
-        elif 'kg' in quantity_str:  # kilogram quantities
-            quantity = float(quantity_str.replace('kg', ''))
-        elif 'ml' in quantity_str:  # milliliter quantities
-            quantity = float(quantity_str.replace('ml', ''))*0.001
-        elif 'l' in quantity_str:  # liter quantities
-            quantity = float(quantity_str.replace('l', ''))
-        elif 'tasse' in quantity_str:  # cup quantities
-            quantity_str = quantity_str.replace('tasse', '')
-            quantity = float(fractions.Fraction(quantity_str)) * 0.24
-        elif '/' in quantity_str:  # fractions
-            quantity = float(fractions.Fraction(quantity_str)) 
-        else : 
-            quantity = 0.1
-        return quantity
+        """
+        Parse the quantity of an ingredient in kg with the common quantity parser
+        :param quantity_str: quantity of the ingredient
+        :return: quantity in kg, 0 if it is an invariant
+        """
+        return quantity_kg(quantity_str)
 
     def get_ingredient_costs(self, recipe):
-        with open(self.ingredient_file, 'r', encoding='utf-8') as f:  # Change 'filename' to 'self.ingredient_file'
-            data = json.load(f)
-            ingredient_names = [ingredient['name'] for ingredient in recipe['ingredients']] 
-            ingredient_names = list(dict.fromkeys(ingredient_names))
-            total_costs = {'USP': {'direct_price': 0, 'quantity_price': 0, 'kg_price': 0}, 
-                        'ALDI': {'direct_price': 0, 'quantity_price': 0, 'kg_price': 0}}
-            for ingredient_name in ingredient_names:
-                quantity = next(ingredient['quantity'] for ingredient in recipe['ingredients'] if ingredient['name'] == ingredient_name) 
-                quantity = self.parse_quantity(quantity)
-                for source in ['USP', 'ALDI']:
-                    for item in data:
-                        if item['ingredient'] == ingredient_name and item['source'] == source or ingredient_name in item.get('other_ingredients', []) and item['source'] == source:
-                            item['price_per_kg'] = item['price_kg']
-                            item['direct_price'] = item['price']
-                            if item['price_kg'] != -1: 
-                                if quantity == 0:  # Set a default quantity if none 
-                                    quantity = 0.1
-                                item['quantity_price'] = quantity * item['price_kg']
-                            else:
-                                item['quantity_price'] = item['price']
-
-                            print(f"Source : {item['source']}")
-                            print(f"Ingredient original : {ingredient_name}")
-                            print(f"Ingrédient : {item['ingredient']}")
-                            print(f"Prix par kg : {item['price_per_kg']}")
-                            print(f"Prix direct : {item['direct_price']}")
-                            print(f"Prix selon quantité : {item.get('quantity_price', 'Non disponible')}")
-                            print("-----------------------------")
-                            
-                            # add prices 
-                            total_costs[source]['kg_price'] += item['price_per_kg']
-                            total_costs[source]['direct_price'] += item['direct_price']
-                            total_costs[source]['quantity_price'] += item.get('quantity_price', 0)
-                            break
+        data = self.get_items()
+        index = self.get_index()
+        ingredient_names = [ingredient['name'] for ingredient in recipe['ingredients']] 
+        ingredient_names = list(dict.fromkeys(ingredient_names))
+        total_costs = {'USP': {'direct_price': 0, 'quantity_price': 0, 'kg_price': 0}, 
+                    'ALDI': {'direct_price': 0, 'quantity_price': 0, 'kg_price': 0}}
+        for ingredient_name in ingredient_names:
+            quantity = next(ingredient['quantity'] for ingredient in recipe['ingredients'] if ingredient['name'] == ingredient_name) 
+            quantity = self.parse_quantity(quantity)
+            for source in ['USP', 'ALDI']:
+                # first item of the source having the ingredient, found in the index instead of going through the items
+                position = index.get((ingredient_name, source))
+                if position is None:
+                    continue
+                direct_price, price_per_kg = item_prices(data, position)
+                if price_per_kg != -1: 
+                    if quantity == 0:  # Set a default quantity if none 
+                        quantity = 0.1
+                    quantity_price = quantity * price_per_kg
+                else:
+                    quantity_price = direct_price
+
+                print(f"Source : {source}")
+                print(f"Ingredient original : {ingredient_name}")
+                print(f"Ingrédient : {data[position]['ingredient']}")
+                print(f"Prix par kg : {price_per_kg}")
+                print(f"Prix direct : {direct_price}")
+                print(f"Prix selon quantité : {quantity_price}")
+                print("-----------------------------")
+                
+                # add prices 
+                total_costs[source]['kg_price'] += price_per_kg
+                total_costs[source]['direct_price'] += direct_price
+                total_costs[source]['quantity_price'] += quantity_price
 
 
         for source in total_costs.keys():
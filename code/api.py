@@ -26,23 +26,52 @@ __authors__ = "Anthony Gugler, Florian Hofmann, Jérémy Jordan"
 __date__ = "05.05.2023"
 
 import uvicorn
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, Header, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import RedirectResponse
+from fastapi.responses import JSONResponse, RedirectResponse, Response, StreamingResponse
+from pydantic import BaseModel
 from datetime import datetime
 from analyser.analyse import DataAnalyser
+from elasticdriver.async_price_analysis import AsyncPriceAnalysis
 from elasticdriver.price_analysis import PriceAnalysis
 from dataprocessing.dataprocesser import DataProcesser
-from elasticdriver.elastic import ElasticDriver
-from threading import Thread
+from dataprocessing.calculate_price import RecipeCostCalculator
+from dataprocessing.cluster_model import NAME_CLUSTERS, ClusterModel
+from dataprocessing.jsonstream import read_records
+from elasticdriver.backend import BACKEND_ELASTICSEARCH, SUGGEST_MAX_SIZE, SUGGEST_SIZE, SearchBackend, create_backend
+from elasticdriver.elastic import ALIAS_ITEMS, ALIAS_RECIPES, data_fingerprint
+from elasticdriver.embedded import PrefixIndex, popularity, suggestion_key
+from elasticdriver.ingredient_cache import IngredientCache
+from elasticdriver.response_cache import ResponseCache, etag_matches, normalize_query
+from contextlib import asynccontextmanager
+from elasticsearch import ApiError, TransportError
+from threading import Lock, Thread
+import json
 import os
+import shutil
+import time
 
 api_description = """
 Return the price estimation of a recipe scraped from Marmiton website
 """
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global fetcher
+    # asynchronous view of the backend, one Elasticsearch client whose connection pool is shared by all the requests
+    fetcher = AsyncPriceAnalysis(backend=db.async_backend(), cache=ingredient_cache)
+    # the indices are prepared in the background, the requests are accepted right away and /readyz tells when
+    # the indices hold the current data
+    Thread(target=prepare_indices, daemon=True).start()
+    yield
+    await fetcher.close()
+    db.close()
+
+
 # Define the FastAPI application with information
 app = FastAPI(
+    lifespan=lifespan,
     title="Des recettes et des prix - API",
     description=api_description,
     version="0.0.1",
@@ -66,8 +95,142 @@ app.add_middleware(
 # components
 analyser: DataAnalyser = DataAnalyser()
 processer: DataProcesser = DataProcesser()
-db: ElasticDriver = ElasticDriver()
-fetcher: PriceAnalysis = PriceAnalysis()
+# Elasticsearch, or the engine embedded in the process with SEARCH_BACKEND=embedded
+db: SearchBackend = create_backend(os.environ.get('SEARCH_BACKEND', BACKEND_ELASTICSEARCH))
+# prices of the ingredients already looked up, shared with the other workers when a file is given
+ingredient_cache: IngredientCache = IngredientCache(path=os.environ.get('INGREDIENT_CACHE_PATH'))
+# a new version of an index makes the cached prices of the previous one unreachable
+db.listeners.append(ingredient_cache.set_generation)
+# encoded responses of the recipes, for the current scraping and versions of the indices
+response_cache: ResponseCache = ResponseCache()
+# the indices loaded again when the API starts don't change the timestamp of the scraping
+db.listeners.append(response_cache.set_version)
+# time during which browsers and proxies reuse a response before checking its ETag, in seconds
+RESPONSE_MAX_AGE = 300
+# number of recipes priced by one request of /recipes/price
+PRICE_REQUEST_MAX = 1000
+# created with the event loop in the lifespan of the application
+fetcher: AsyncPriceAnalysis = None
+# fitted price clusters, to label the recipes indexed without a cluster
+PATH_CLUSTER_MODEL = '../data/cluster_model.json'
+# items, recipes with their cluster, and the same recipes with their response materialized
+PATH_ITEMS = '../data/items_ingredient.json'
+PATH_RECIPES = '../data/recipe_marmiton_with_cluster.json'
+PATH_RECIPES_PRICED = '../data/recipe_marmiton_priced.json'
+PATH_COSTS = '../data/recipe_costs.json'
+cluster_model = ClusterModel.load(PATH_CLUSTER_MODEL)
+# costs of the recipes labelled in the API, with the items chosen by the costing pipeline
+cost_calculator = RecipeCostCalculator(PATH_COSTS, PATH_RECIPES, PATH_ITEMS)
+# names of the recipes completed in the process while Elasticsearch doesn't answer
+suggestions: PrefixIndex = PrefixIndex({})
+# time until which the names are completed without asking Elasticsearch again, after it failed
+suggest_fallback_until: float = 0
+# time during which Elasticsearch is not asked again after it failed to complete a name, in seconds
+SUGGEST_RETRY_DELAY = 5
+
+
+def label_recipe(recipe: dict) -> None:
+    """
+    Give their clusters to a recipe indexed without them (scraped after the last update of the clusters),
+    from its costs computed like the costs the clusters are fitted on
+    :param recipe: the recipe returned by the fetcher
+    """
+    missing = [source for source, name_cluster in NAME_CLUSTERS.items() if name_cluster not in recipe]
+    if cluster_model is None or len(missing) == 0:
+        return
+    costs = cost_calculator.get_ingredient_costs(recipe)
+    for source in missing:
+        recipe[NAME_CLUSTERS[source]] = cluster_model.assign(source, costs[source]['quantity_price'])
+
+
+# state of the indices reported by /readyz, updated by the thread preparing them
+readiness: dict = {"ready": False, "state": "starting", "indexed": {}, "error": None, "since": time.time()}
+# held while the indices are prepared or loaded again by /scrape, only one of them writes the indices at a time
+index_lock = Lock()
+# delay before preparing the indices again after a failure, doubled at each failure up to the maximum, in seconds
+PREPARE_RETRY_DELAY = 1
+PREPARE_RETRY_MAX_DELAY = 60
+# delay given to the clients in the header Retry-After while the indices are not ready, in seconds
+RETRY_AFTER = 10
+
+
+def report_progress(alias: str):
+    """
+    Give the function reporting the number of documents indexed in an index
+    :param alias: name of the index
+    """
+    def progress(count: int) -> None:
+        readiness["indexed"][alias] = count
+    return progress
+
+
+def load_suggestions() -> None:
+    """
+    Load the names of the recipes completed in the process, ranked like the completion field of the index
+    """
+    global suggestions
+    suggestions = PrefixIndex(popularity(recipe['name'] for recipe in read_records(PATH_RECIPES)))
+    print(f"{len(suggestions)} completions of the recipe names loaded")
+
+
+def index_recipes(fingerprint: str = None) -> None:
+    """
+    Materialize the response of every recipe with the items indexed and index the recipes with their response
+    :param fingerprint: fingerprint of the data files
+    """
+    analysis = PriceAnalysis(backend=db, cache=ingredient_cache)
+    analysis.materialize_recipes(PATH_RECIPES, PATH_RECIPES_PRICED)
+    db.index_data(ALIAS_RECIPES, PATH_RECIPES_PRICED, fingerprint=fingerprint, progress=report_progress(ALIAS_RECIPES))
+
+
+def index_all(fingerprint: str) -> None:
+    """
+    Index the items and the recipes, then keep a snapshot of the indices
+    :param fingerprint: fingerprint of the data files
+    """
+    db.index_data(ALIAS_ITEMS, PATH_ITEMS, fingerprint=fingerprint, progress=report_progress(ALIAS_ITEMS))
+    index_recipes(fingerprint)
+    db.create_snapshot(fingerprint, [ALIAS_ITEMS, ALIAS_RECIPES])
+
+
+def prepare_indices() -> None:
+    """
+    Make the indices hold the current data files: they are kept if their fingerprint is the one of the files,
+    restored if a snapshot of the files exists, indexed otherwise.
+    Elasticsearch may not be reachable yet when the API starts, a failure is retried with a growing delay
+    """
+    delay = PREPARE_RETRY_DELAY
+    while True:
+        try:
+            with index_lock:
+                readiness["state"] = "checking"
+                load_suggestions()
+                fingerprint = data_fingerprint(PATH_ITEMS, PATH_RECIPES)
+                aliases = [ALIAS_ITEMS, ALIAS_RECIPES]
+                if all(db.is_current(alias, fingerprint) for alias in aliases):
+                    print("The indices hold the current data")
+                else:
+                    readiness["state"] = "restoring"
+                    if not db.restore_snapshot(fingerprint, aliases):
+                        print("Creating index...")
+                        readiness["state"] = "indexing"
+                        index_all(fingerprint)
+            readiness.update(ready=True, state="ready", error=None)
+            return
+        except Exception as e:
+            readiness.update(state="failed", error=str(e))
+            print(f"Failed to prepare the indices, next try in {delay}s: {e!r}")
+            time.sleep(delay)
+            delay = min(delay * 2, PREPARE_RETRY_MAX_DELAY)
+
+
+def check_ready() -> None:
+    """
+    Refuse a request using the indices while they are not ready
+    """
+    if not readiness["ready"]:
+        raise HTTPException(status_code=503, detail=f"The indices are not ready: {readiness['state']}",
+                            headers={"Retry-After": str(RETRY_AFTER)})
 
 
 # Redirect to docs
@@ -76,25 +239,131 @@ async def root():
     return RedirectResponse("/docs", status_code=301)
 
 
-@app.on_event("startup")
-async def startup_event():
-    # check if data is already indexed
-    if os.path.exists("./.indexed"):
-        return
-    print("Creating index...")
-    # Index the data using the index_data method
-    db.index_data('items_ingredient', '../data/items_ingredient.json')
-    db.index_data('recipe_marmiton', '../data/recipe_marmiton_with_cluster.json')
-    # create .indexed file to avoid reindexing
-    open("./.indexed", "w").close()
+@app.get("/recipe/{query}")
+async def recipe(query: str, if_none_match: str = Header(None)):
+    check_ready()
+    key = ("recipe", normalize_query(query), response_cache.generation())
+    cached = response_cache.get(key)
+    if cached is None:
+        recipe: dict = await fetcher.query_recipe(query)
+        if recipe is None:
+            raise HTTPException(status_code=404, detail="Item not found")
+        label_recipe(recipe)
+        body = JSONResponse(recipe).body
+        if PriceAnalysis.failed_lookup(recipe):
+            # the prices missing are searched again by the next request, the response is neither cached nor reused
+            return Response(content=body, media_type="application/json", headers={"Cache-Control": "no-store"})
+        cached = (response_cache.put(key, body), body)
+    etag, body = cached
+    headers = {"ETag": etag, "Cache-Control": f"public, max-age={RESPONSE_MAX_AGE}"}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
 
 
-@app.get("/recipe/{query}")
-async def recipe(query: str):
-    recipe: dict = fetcher.query_recipe(query)
-    if recipe is None:
-        raise HTTPException(status_code=404, detail="Item not found")
-    return recipe
+class RecipesPriceRequest(BaseModel):
+    # queries searched like /recipe/{query}, and ids of recipes
+    queries: list[str] = []
+    ids: list[str] = []
+
+
+def price_line(kind: str, key: str, body: bytes = None, error: str = None) -> bytes:
+    """
+    Build a line of the response of /recipes/price
+    :param kind: "query" or "id"
+    :param key: the query or the id
+    :param body: the encoded recipe, None when it is not found
+    :param error: the error of the search of the recipe, None when it succeeded
+    :return: the line, in JSON
+    """
+    line = b'{"' + kind.encode() + b'":' + json.dumps(key, ensure_ascii=False).encode()
+    if error is not None:
+        return line + b',"error":' + json.dumps(error, ensure_ascii=False).encode() + b'}\n'
+    return line + b',"recipe":' + (body if body is not None else b'null') + b'}\n'
+
+
+@app.post("/recipes/price")
+async def recipes_price(request: RecipesPriceRequest):
+    check_ready()
+    if len(request.queries) + len(request.ids) > PRICE_REQUEST_MAX:
+        raise HTTPException(status_code=413, detail=f"At most {PRICE_REQUEST_MAX} recipes can be priced at once")
+    generation = response_cache.generation()
+    # the queries searched the same way are searched once, each variant sent gets its line
+    variants: dict = {}
+    for query in request.queries:
+        variants.setdefault(normalize_query(query), {})[query] = None
+    cached_lines = []
+    queries = []
+    for query, originals in variants.items():
+        cached = response_cache.get(("recipe", query, generation))
+        if cached is None:
+            queries.append(query)
+            continue
+        cached_lines += [price_line("query", original, cached[1]) for original in originals]
+    ids = list(dict.fromkeys(request.ids))
+    # the recipes not sent yet, in the order of the request
+    pending = dict.fromkeys([("query", query) for query in queries] + [("id", doc_id) for doc_id in ids])
+
+    results = fetcher.price_recipes(queries, ids)
+    # the first batch is fetched before answering, a search backend down gives an error status
+    try:
+        first = await anext(results, None)
+    except (ApiError, TransportError) as e:
+        raise HTTPException(status_code=503, detail=f"The search backend failed: {e}",
+                            headers={"Retry-After": str(RETRY_AFTER)})
+
+    def result_lines(kind: str, key: str, recipe: dict, error: str) -> list:
+        pending.pop((kind, key), None)
+        body = None
+        if recipe is not None:
+            label_recipe(recipe)
+            body = JSONResponse(recipe).body
+        if kind == "id":
+            return [price_line(kind, key, body, error)]
+        if body is not None and not PriceAnalysis.failed_lookup(recipe):
+            response_cache.put(("recipe", key, generation), body)
+        return [price_line(kind, original, body, error) for original in variants[key]]
+
+    async def lines():
+        for line in cached_lines:
+            yield line
+        if first is None:
+            return
+        for line in result_lines(*first):
+            yield line
+        try:
+            async for result in results:
+                for line in result_lines(*result):
+                    yield line
+        except Exception as e:
+            # the status is already sent, the recipes not priced get the error instead of a cut response
+            print(f"Failed to price the recipes: {e!r}")
+            for kind, key in list(pending):
+                for line in result_lines(kind, key, None, f"The search backend failed: {e}"):
+                    yield line
+
+    # one recipe per line, sent as soon as it is priced
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+@app.get("/suggest")
+async def suggest(prefix: str, size: int = SUGGEST_SIZE):
+    global suggest_fallback_until
+    size = max(1, min(size, SUGGEST_MAX_SIZE))
+    names = None
+    if not suggestion_key(prefix):
+        names = []
+    elif time.monotonic() >= suggest_fallback_until:
+        try:
+            names = await fetcher.backend.suggest(prefix, ALIAS_RECIPES, size)
+        except (ApiError, TransportError, ValueError) as e:
+            # Elasticsearch is down or the index is not ready, the names are completed here for a while
+            print(f"Completing the names without the search backend: {e}")
+            suggest_fallback_until = time.monotonic() + SUGGEST_RETRY_DELAY
+    if names is None:
+        names = suggestions.suggest(prefix, size)
+    return JSONResponse({"prefix": prefix, "suggestions": names},
+                        headers={"Cache-Control": f"public, max-age={RESPONSE_MAX_AGE}"})
 
 
 @app.get("/scrape")
@@ -115,35 +384,73 @@ async def scrape():
             # Call the parse_aldi method
             data_processor.parse_aldi('../data/aldi_clean.json')
 
-            data_processor.parse_marmiton('../data/recipe_marmiton.json')
+            # keep the previous items to update only the recipes affected by the changes
+            path_items = '../data/items_ingredient.json'
+            path_previous_items = '../data/items_ingredient_previous.json'
+            if os.path.exists(path_items):
+                shutil.copyfile(path_items, path_previous_items)
 
-            # Import the ElasticDriver class
-            from elasticdriver.elastic import ElasticDriver
+            data_processor.parse_marmiton('../data/recipe_marmiton.json')
 
-            # Instantiate the ElasticDriver object
-            driver = ElasticDriver()
+            global cluster_model, cost_calculator
+            if os.path.exists(path_previous_items) and os.path.exists(PATH_COSTS):
+                calculator = RecipeCostCalculator(PATH_COSTS, '../data/recipe_marmiton.json',
+                                                  path_items, '../data/recipe_marmiton_with_cluster.json')
+                calculator.run_delta(path_previous_items)
+                # the clusters may have been fitted again
+                cluster_model = ClusterModel.load(PATH_CLUSTER_MODEL)
+            # the recipes are labelled with the new items
+            cost_calculator = RecipeCostCalculator(PATH_COSTS, PATH_RECIPES, PATH_ITEMS)
 
-            # Index the data using the index_data method
-            driver.index_data('items_ingredient', '../data/items_ingredient.json')
+            # Index the data using the index_data method, with the backend of the API,
+            # the responses of the recipes are computed again with the new items
+            index_all(data_fingerprint(PATH_ITEMS, PATH_RECIPES))
+            load_suggestions()
 
             with open("last_action_timestamp.txt", "w") as f:
                 f.write(str(int(datetime.now().timestamp())))
         else:  # command execution failed
             print("Scraping failed. Post-processing is not started.")
 
-    thread = Thread(target=run_scraper)
+    def run_exclusively():
+        try:
+            run_scraper()
+        finally:
+            index_lock.release()
+
+    # the indices are loaded again at the end of the scraping, not while they are prepared or by another scraping
+    if not readiness["ready"] or not index_lock.acquire(blocking=False):
+        raise HTTPException(status_code=409, detail="The indices are being prepared, try again later")
+    thread = Thread(target=run_exclusively)
     thread.start()
     return {"status": "Scraping started"}
 
 
 @app.get("/price}")
 async def recipe(query: str):
-    recipe: dict = fetcher.query_recipe(query)
+    recipe: dict = await fetcher.query_recipe(query)
     if recipe is None:
         raise HTTPException(status_code=404, detail="Item not found")
     return recipe
 
 
+@app.get("/healthz")
+async def healthz():
+    # the process is up, the indices may still be prepared
+    return {"status": "ok"}
+
+
+@app.get("/readyz")
+async def readyz():
+    status = {**readiness, "elapsed": round(time.time() - readiness["since"], 1)}
+    return JSONResponse(status, status_code=200 if readiness["ready"] else 503)
+
+
+@app.get("/cache")
+async def cache_stats():
+    return ingredient_cache.stats()
+
+
 @app.get("/date")
 async def last_action_date():
     # read value from last_action_date.txt
@@ -0,0 +1,88 @@
+# Copyright (c) 2023 Anthony Gugler, Florian Hofmann and Jérémy Jordan
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+File containing an Aho-Corasick automaton to search many names at once in a text
+"""
+
+__authors__ = "Anthony Gugler, Florian Hofmann, Jérémy Jordan"
+__date__ = "18.10.2026"
+
+from collections import deque
+
+
+class AhoCorasick:
+
+    def __init__(self, patterns: list):
+        """
+        Constructor, compile the patterns into the automaton
+        @param patterns: list of the strings to search
+        """
+        self.patterns = patterns
+        # transitions, failure link, pattern ending on the node and link to the next node having an output
+        self.__goto: list = [{}]
+        self.__fail: list = [0]
+        self.__output: list = [-1]
+        self.__output_link: list = [0]
+
+        # build the trie of the patterns
+        for index, pattern in enumerate(patterns):
+            node = 0
+            for char in pattern:
+                if char not in self.__goto[node]:
+                    self.__goto.append({})
+                    self.__fail.append(0)
+                    self.__output.append(-1)
+                    self.__output_link.append(0)
+                    self.__goto[node][char] = len(self.__goto) - 1
+                node = self.__goto[node][char]
+            if pattern != "" and self.__output[node] == -1:
+                self.__output[node] = index
+
+        # compute the failure links in breadth first order
+        queue = deque(self.__goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self.__goto[node].items():
+                fail = self.__fail[node]
+                while fail != 0 and char not in self.__goto[fail]:
+                    fail = self.__fail[fail]
+                fail = self.__goto[fail].get(char, 0)
+                self.__fail[child] = fail
+                self.__output_link[child] = fail if self.__output[fail] != -1 else self.__output_link[fail]
+                queue.append(child)
+
+    def search(self, text: str) -> set:
+        """
+        Find every pattern contained in the text
+        @param text: text to search in
+        @return: set with the index of the patterns found
+        """
+        found: set = set()
+        node = 0
+        for char in text:
+            while node != 0 and char not in self.__goto[node]:
+                node = self.__fail[node]
+            node = self.__goto[node].get(char, 0)
+            match = node if self.__output[node] != -1 else self.__output_link[node]
+            while match != 0:
+                found.add(self.__output[match])
+                match = self.__output_link[match]
+        return found
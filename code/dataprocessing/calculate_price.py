@@ -26,84 +26,163 @@ __authors__ = "Anthony Gugler, Florian Hofmann, Jérémy Jordan"
 __date__ = "26.05.2023"
 
 import json
-import fractions
-import re
+import os
+import sys
+from collections import Counter
+
+import numpy as np
+from scipy.sparse import csr_matrix
+
+from dataprocessing.catalogue import ingredient_index, item_prices, load_items
+from dataprocessing.clustering_price import update_clusters
+from dataprocessing.jsonstream import read_records
+from dataprocessing.quantity import parse_quantities, quantity_kg
+
+FILENAME_DEPENDENCIES = "recipe_dependencies.json"
+
+
+
+def quantity_cost(quantity, price, price_kg):
+    """
+    Cost of the quantity of an ingredient with the item chosen for it
+    :param quantity: quantity of the ingredient in kg, 0 if it is an invariant
+    :param price: price of the item
+    :param price_kg: price per kg of the item, -1 if it is sold by piece
+    :return: the cost, the price of the item when it is sold by piece
+    """
+    if price_kg != -1:
+        if quantity == 0:  # Set a default quantity if none
+            quantity = 0.1
+        return quantity * price_kg
+    return price
 
 
 class RecipeCostCalculator:
 
-    def __init__(self, path_cost, path_recipes, path_ingredients):
+    def __init__(self, path_cost, path_recipes, path_ingredients, path_clusters=None):
         self.path_cost = path_cost
         self.path_recipes = path_recipes
         self.path_ingredients = path_ingredients
+        # recipes with their cluster, updated with the costs when given
+        self.path_clusters = path_clusters
+        # reverse index from the ingredients to the recipes using them
+        self.path_dependencies = os.path.join(os.path.dirname(path_cost), FILENAME_DEPENDENCIES)
+        self.__items = None
+        self.__index = None
+
+    def get_items(self):
+        """
+        Load the items once, from the columnar catalogue when it is up to date
+        :return: PriceCatalogue or list of the items
+        """
+        if self.__items is None:
+            self.__items = load_items(self.path_ingredients)
+        return self.__items
+
+    def get_index(self):
+        """
+        Build once the index from (ingredient name, source) to the item chosen for it
+        :return: dict from (ingredient name, source) to the position of the item
+        """
+        if self.__index is None:
+            self.__index = ingredient_index(self.get_items())
+        return self.__index
 
     def parse_quantity(self, quantity_str):
-        quantity_str = quantity_str.replace('l', '').strip()
-        # Remove non-numeric parts of the string
-        quantity_str = re.sub("[^\d\/\.]", "", quantity_str)
-
-        if ',' in quantity_str:  # decimal quantities
-            quantity = float(quantity_str.replace(',', '.'))
-        elif '%' in quantity_str:  # percentage quantities
-            quantity = float(quantity_str.replace('%', '')) * 0.01
-        elif 'cl' in quantity_str:  # centiliter quantities
-            quantity = float(quantity_str.replace('cl', '')) * 0.01
-        elif 'g' in quantity_str:  # gram quantities
-            quantity = float(quantity_str.replace('g', '')) * 0.001
-        elif 'kg' in quantity_str:  # kilogram quantities
-            quantity = float(quantity_str.replace('kg', ''))
-        elif 'ml' in quantity_str:  # milliliter quantities
-            quantity = float(quantity_str.replace('ml', '')) * 0.001
-        elif 'l' in quantity_str:  # liter quantities
-            quantity = float(quantity_str.replace('l', ''))
-        elif 'tasse' in quantity_str:  # cup quantities
-            quantity_str = quantity_str.replace('tasse', '')
-            quantity = float(fractions.Fraction(quantity_str)) * 0.24
-        elif '/' in quantity_str:  # fractions
-            quantity = float(fractions.Fraction(quantity_str))
-        else:
-            quantity = 0.1
-        return quantity
+        """
+        Parse the quantity of an ingredient in kg with the common quantity parser
+        :param quantity_str: quantity of the ingredient
+        :return: quantity in kg, 0 if it is an invariant
+        """
+        return quantity_kg(quantity_str)
 
     def get_ingredient_costs(self , recipe):
-        with open(self.path_ingredients, 'r') as f:
-            data = json.load(f)
-            ingredient_names = [ingredient['name'] for ingredient in recipe['ingredients']]
-            ingredient_names = list(dict.fromkeys(ingredient_names))
-            total_costs = {'USP': {'direct_price': 0, 'quantity_price': 0, 'kg_price': 0},
-                           'ALDI': {'direct_price': 0, 'quantity_price': 0, 'kg_price': 0}}
-            for ingredient_name in ingredient_names:
-                quantity = next(ingredient['quantity'] for ingredient in recipe['ingredients'] if
-                                ingredient['name'] == ingredient_name)
-                quantity = self.parse_quantity(quantity)
-                for source in ['USP', 'ALDI']:
-                    for item in data:
-                        if item['ingredient'] == ingredient_name and item[
-                            'source'] == source or ingredient_name in item.get('other_ingredients', []) and item[
-                            'source'] == source:
-                            item['price_per_kg'] = item['price_kg']
-                            item['direct_price'] = item['price']
-                            if item['price_kg'] != -1:
-                                if quantity == 0:  # Set a default quantity if none
-                                    quantity = 0.1
-                                item['quantity_price'] = quantity * item['price_kg']
-                            else:
-                                item['quantity_price'] = item['price']
-
-                            # add prices
-                            total_costs[source]['kg_price'] += item['price_per_kg']
-                            total_costs[source]['direct_price'] += item['direct_price']
-                            total_costs[source]['quantity_price'] += item.get('quantity_price', 0)
-                            break
+        data = self.get_items()
+        index = self.get_index()
+        # keep the quantity of the first occurrence of each ingredient
+        quantities = {}
+        for ingredient in recipe['ingredients']:
+            quantities.setdefault(ingredient['name'], ingredient['quantity'])
+        total_costs = {'USP': {'direct_price': 0, 'quantity_price': 0, 'kg_price': 0},
+                       'ALDI': {'direct_price': 0, 'quantity_price': 0, 'kg_price': 0}}
+        for ingredient_name, quantity in quantities.items():
+            quantity = self.parse_quantity(quantity)
+            for source in ['USP', 'ALDI']:
+                position = index.get((ingredient_name, source))
+                if position is None:
+                    continue
+                price, price_kg = item_prices(data, position)
+                quantity_price = quantity_cost(quantity, price, price_kg)
+
+                # add prices
+                total_costs[source]['kg_price'] += price_kg
+                total_costs[source]['direct_price'] += price
+                total_costs[source]['quantity_price'] += quantity_price
         return total_costs
 
     def get_all_recipes_cost(self):
+        """
+        Compute the cost of every recipe at once. The recipes are put in a sparse matrix recipes x ingredients,
+        each source gives the value of every entry and the costs are the sums of the rows (in the same order
+        as get_ingredient_costs adds them).
+        :return: dict with the costs of each recipe by name
+        """
+        data = self.get_items()
+        index = self.get_index()
+
+        # build the structure of the matrix, with the quantity of the first occurrence of each ingredient
+        recipe_names = []
+        indptr = [0]
+        indices = []
+        quantities = []
+        columns = {}
+        for recipe in read_records(self.path_recipes):
+            recipe_quantities = {}
+            for ingredient in recipe['ingredients']:
+                recipe_quantities.setdefault(ingredient['name'], ingredient['quantity'])
+            for ingredient_name, quantity in recipe_quantities.items():
+                indices.append(columns.setdefault(ingredient_name, len(columns)))
+                quantities.append(quantity)
+            indptr.append(len(indices))
+            recipe_names.append(recipe['name'])
+        print(f"Processing {len(recipe_names)} recipes with {len(columns)} different ingredients")
+
+        indices = np.asarray(indices, dtype=np.int64)
+        shape = (len(recipe_names), len(columns))
+        quantity, _ = parse_quantities(quantities)
+        quantity[quantity == 0] = 0.1  # Set a default quantity if none
+        ones = np.ones(len(columns))
+
+        def row_sums(values):
+            return csr_matrix((values, indices, indptr), shape=shape) @ ones
+
+        costs = {}
+        for source in ['USP', 'ALDI']:
+            # prices of the item chosen for each ingredient, 0 when there is none
+            found = np.zeros(len(columns), dtype=bool)
+            price = np.zeros(len(columns))
+            price_kg = np.zeros(len(columns))
+            for ingredient_name, column in columns.items():
+                position = index.get((ingredient_name, source))
+                if position is not None:
+                    found[column] = True
+                    price[column], price_kg[column] = item_prices(data, position)
+
+            # value of each entry of the matrix
+            entry_price = price[indices]
+            entry_price_kg = price_kg[indices]
+            entry_quantity_price = np.where(entry_price_kg != -1, quantity * entry_price_kg, entry_price)
+            entry_quantity_price[~found[indices]] = 0
+            costs[source] = {
+                'direct_price': row_sums(entry_price),
+                'quantity_price': row_sums(entry_quantity_price),
+                'kg_price': row_sums(entry_price_kg),
+            }
+
         all_recipes_costs = {}
-        with open(self.path_recipes, 'r') as f:
-            recipes = json.load(f)
-            for i, recipe in enumerate((recipes)):
-                print(f"Processing recipe #{i + 1}: {recipe['name']}")
-                all_recipes_costs[recipe['name']] = self.get_ingredient_costs(recipe)
+        for i, name in enumerate(recipe_names):
+            all_recipes_costs[name] = {source: {key: float(values[i]) for key, values in source_costs.items()}
+                                       for source, source_costs in costs.items()}
         return all_recipes_costs
 
     def save_costs_to_file(self, data):
@@ -113,6 +192,132 @@ class RecipeCostCalculator:
     def run(self):
         all_recipes_costs = self.get_all_recipes_cost()
         self.save_costs_to_file(all_recipes_costs)
+        self.save_dependencies(self.build_dependencies())
+
+    def __recipes_fingerprint(self):
+        """
+        Fingerprint of the recipes file, the dependencies are built again when it changes
+        :return: list with the size and the modification time of the file
+        """
+        stat = os.stat(self.path_recipes)
+        return [stat.st_size, stat.st_mtime]
+
+    def build_dependencies(self):
+        """
+        Build the reverse index from each ingredient to the recipes using it
+        :return: dict from the ingredient name to the list of recipe names
+        """
+        dependencies = {}
+        for recipe in read_records(self.path_recipes):
+            for ingredient in recipe['ingredients']:
+                recipes = dependencies.setdefault(ingredient['name'], [])
+                if len(recipes) == 0 or recipes[-1] != recipe['name']:
+                    recipes.append(recipe['name'])
+        return dependencies
+
+    def save_dependencies(self, dependencies):
+        with open(self.path_dependencies, 'w', encoding='utf8') as f:
+            json.dump({'recipes': self.__recipes_fingerprint(), 'ingredients': dependencies}, f, ensure_ascii=False)
+
+    def load_dependencies(self):
+        """
+        Load the reverse index, it is built again if the recipes changed since it was saved
+        :return: dict from the ingredient name to the list of recipe names
+        """
+        if os.path.exists(self.path_dependencies):
+            with open(self.path_dependencies, 'r', encoding='utf8') as f:
+                data = json.load(f)
+            if data['recipes'] == self.__recipes_fingerprint():
+                return data['ingredients']
+        dependencies = self.build_dependencies()
+        self.save_dependencies(dependencies)
+        return dependencies
+
+    @staticmethod
+    def item_key(item):
+        """
+        Key identifying an item between two versions of the items file
+        :param item: the item
+        :return: tuple with the source, the name and the link of the item
+        """
+        return item['source'], item['name'], item.get('link')
+
+    @classmethod
+    def keyed_items(cls, items):
+        """
+        Index the items by their key, the items sharing a key (the USP items have no link) are told apart
+        by their occurrence number
+        :param items: list of the items
+        :return: dict from the key and the occurrence number to the item
+        """
+        occurrences = Counter()
+        keyed = {}
+        for item in items:
+            key = cls.item_key(item)
+            keyed[key + (occurrences[key],)] = item
+            occurrences[key] += 1
+        return keyed
+
+    def changed_ingredients(self, path_previous_ingredients):
+        """
+        Find the ingredients whose chosen item is not the same as in the previous version of the items.
+        Only the ingredients of the items added, removed or modified are checked.
+        :param path_previous_ingredients: path to the previous version of the items JSON file
+        :return: set of the ingredient names
+        """
+        previous = list(load_items(path_previous_ingredients))
+        current = list(self.get_items())
+        previous_items = self.keyed_items(previous)
+        current_items = self.keyed_items(current)
+
+        candidates = set()
+        for key in previous_items.keys() | current_items.keys():
+            previous_item, current_item = previous_items.get(key), current_items.get(key)
+            if previous_item == current_item:
+                continue
+            for item in (previous_item, current_item):
+                if item is not None:
+                    candidates.add((item['ingredient'], item['source']))
+                    candidates.update((name, item['source']) for name in item.get('other_ingredients', []))
+
+        previous_index = ingredient_index(previous)
+        current_index = self.get_index()
+
+        def chosen(items, index, candidate):
+            position = index.get(candidate)
+            if position is None:
+                return None
+            return self.item_key(items[position]), items[position]['price'], items[position]['price_kg']
+
+        return {name for name, source in candidates
+                if chosen(previous, previous_index, (name, source)) != chosen(current, current_index, (name, source))}
+
+    def run_delta(self, path_previous_ingredients):
+        """
+        Compute again only the cost of the recipes using an ingredient whose item changed,
+        then patch the costs file (and the clusters file when given)
+        :param path_previous_ingredients: path to the previous version of the items JSON file
+        :return: set of the names of the recipes updated
+        """
+        ingredients = self.changed_ingredients(path_previous_ingredients)
+        dependencies = self.load_dependencies()
+        recipe_names = set()
+        for ingredient_name in ingredients:
+            recipe_names.update(dependencies.get(ingredient_name, []))
+        print(f"{len(ingredients)} ingredients changed, {len(recipe_names)} recipes to update")
+        if len(recipe_names) == 0:
+            return recipe_names
+
+        with open(self.path_cost, 'r') as f:
+            all_recipes_costs = json.load(f)
+        for recipe in read_records(self.path_recipes):
+            if recipe['name'] in recipe_names:
+                all_recipes_costs[recipe['name']] = self.get_ingredient_costs(recipe)
+        self.save_costs_to_file(all_recipes_costs)
+
+        if self.path_clusters is not None and os.path.exists(self.path_clusters):
+            update_clusters(all_recipes_costs, recipe_names, self.path_clusters)
+        return recipe_names
 
 
 if __name__ == '__main__':
@@ -120,5 +325,11 @@ if __name__ == '__main__':
     PATH_RECIPES = "./data/recipe_marmiton.json"
     PATH_INGREDIENTS = "./data/items_ingredient.json"
 
-    calc = RecipeCostCalculator(PATH_COST, PATH_RECIPES, PATH_INGREDIENTS)
-    calc.run()
\ No newline at end of file
+    PATH_CLUSTERS = "./data/recipe_marmiton_with_cluster.json"
+
+    calc = RecipeCostCalculator(PATH_COST, PATH_RECIPES, PATH_INGREDIENTS, PATH_CLUSTERS)
+    if len(sys.argv) > 1:
+        # only update the recipes affected by the changes since the given version of the items
+        calc.run_delta(sys.argv[1])
+    else:
+        calc.run()
\ No newline at end of file
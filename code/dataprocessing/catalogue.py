@@ -0,0 +1,305 @@
+# Copyright (c) 2023 Anthony Gugler, Florian Hofmann and Jérémy Jordan
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+File containing the columnar catalogue of the items with their price and ingredient.
+The catalogue is a directory of numpy arrays opened with a memory map, so loading it doesn't copy
+the data and the pages are shared between the processes reading it.
+"""
+
+__authors__ = "Anthony Gugler, Florian Hofmann, Jérémy Jordan"
+__date__ = "18.10.2026"
+
+import json
+import os
+import shutil
+
+import numpy as np
+
+from dataprocessing.jsonstream import read_records
+
+# extension of the catalogue directory written next to the items JSON file
+CATALOGUE_EXTENSION = ".catalogue"
+FILENAME_META = "meta.json"
+# extension of the raw values of a column while the catalogue is written
+PART_EXTENSION = ".part"
+# number of values of a column kept in memory before they are written
+CHUNK_SIZE = 65536
+# columns of the catalogue and their type
+COLUMNS = {
+    "price": np.float64,
+    "price_kg": np.float64,
+    "source": np.uint8,
+    "name": np.int32,
+    "ingredient": np.int32,
+    "link": np.int32,
+    "other_offsets": np.int64,
+    "other_ids": np.int32,
+    "string_offsets": np.int64,
+    "strings": np.uint8,
+}
+# id of a string that doesn't exist (like the link of an USP item)
+NO_STRING = -1
+
+
+def catalogue_path(items_path: str) -> str:
+    """
+    Give the path of the catalogue of an items JSON file
+    @param items_path: path to the items JSON file
+    @return: path to the catalogue directory
+    """
+    return os.path.splitext(items_path)[0] + CATALOGUE_EXTENSION
+
+
+class CatalogueWriter:
+
+    def __init__(self, path: str):
+        """
+        Constructor, the columns are written in chunks in the catalogue directory while the items are added,
+        only the table from the strings to their id is kept in memory
+        @param path: path to the catalogue directory
+        """
+        self.__path: str = path
+        os.makedirs(path, exist_ok=True)
+        # the previous catalogue is not used while it is replaced
+        if os.path.exists(os.path.join(path, FILENAME_META)):
+            os.remove(os.path.join(path, FILENAME_META))
+        self.__files: dict = {name: open(self.__part_path(name), "wb") for name in COLUMNS}
+        self.__chunks: dict = {name: [] for name in COLUMNS}
+        self.__counts: dict = {name: 0 for name in COLUMNS}
+        self.__sources: list = []
+        self.__string_ids: dict = {}
+        self.__append("other_offsets", 0)
+        self.__append("string_offsets", 0)
+
+    def __part_path(self, name: str) -> str:
+        """
+        Give the path of the raw values of a column written before the catalogue is saved
+        @param name: name of the column
+        @return: path to the raw file
+        """
+        return os.path.join(self.__path, name + PART_EXTENSION)
+
+    def __append(self, name: str, value) -> None:
+        """
+        Add a value to a column, the chunk of the column is written when it is full
+        @param name: name of the column
+        @param value: the value
+        """
+        chunk = self.__chunks[name]
+        chunk.append(value)
+        self.__counts[name] += 1
+        if len(chunk) >= CHUNK_SIZE:
+            self.__flush(name)
+
+    def __flush(self, name: str) -> None:
+        """
+        Write the chunk of a column
+        @param name: name of the column
+        """
+        np.asarray(self.__chunks[name], dtype=COLUMNS[name]).tofile(self.__files[name])
+        self.__chunks[name] = []
+
+    def __intern(self, string) -> int:
+        """
+        Give the id of a string in the string table, adding it if needed
+        @param string: the string, None if it doesn't exist
+        @return: id of the string
+        """
+        if string is None:
+            return NO_STRING
+        if string not in self.__string_ids:
+            self.__string_ids[string] = len(self.__string_ids)
+            encoded = string.encode("utf8")
+            self.__files["strings"].write(encoded)
+            self.__counts["strings"] += len(encoded)
+            self.__append("string_offsets", self.__counts["strings"])
+        return self.__string_ids[string]
+
+    def add(self, item: dict) -> None:
+        """
+        Add an item to the catalogue
+        @param item: the item in the standard format
+        """
+        if item["source"] not in self.__sources:
+            self.__sources.append(item["source"])
+        self.__append("price", item["price"])
+        self.__append("price_kg", item["price_kg"])
+        self.__append("source", self.__sources.index(item["source"]))
+        self.__append("name", self.__intern(item["name"]))
+        self.__append("ingredient", self.__intern(item["ingredient"]))
+        self.__append("link", self.__intern(item.get("link")))
+        for ingredient in item.get("other_ingredients", []):
+            self.__append("other_ids", self.__intern(ingredient))
+        self.__append("other_offsets", self.__counts["other_ids"])
+
+    def save(self) -> None:
+        """
+        Write the catalogue, each column gets the header of a numpy array followed by its raw values
+        """
+        for name, dtype in COLUMNS.items():
+            if name != "strings":
+                self.__flush(name)
+            self.__files[name].close()
+            header = {"descr": np.lib.format.dtype_to_descr(np.dtype(dtype)), "fortran_order": False,
+                      "shape": (self.__counts[name],)}
+            with open(os.path.join(self.__path, name + ".npy"), "wb") as f, open(self.__part_path(name), "rb") as part:
+                np.lib.format.write_array_header_1_0(f, header)
+                shutil.copyfileobj(part, f)
+            os.remove(self.__part_path(name))
+        # the metadata is written last, a catalogue without it is incomplete
+        with open(os.path.join(self.__path, FILENAME_META), "w", encoding="utf8") as f:
+            json.dump({"sources": self.__sources, "count": self.__counts["price"]}, f, ensure_ascii=False)
+
+
+class PriceCatalogue:
+
+    def __init__(self, path: str):
+        """
+        Constructor, open every column of the catalogue with a memory map
+        @param path: path to the catalogue directory
+        """
+        with open(os.path.join(path, FILENAME_META), encoding="utf8") as f:
+            meta = json.load(f)
+        self.sources: list = meta["sources"]
+        for name in COLUMNS:
+            setattr(self, name, np.load(os.path.join(path, name + ".npy"), mmap_mode="r"))
+        self.__string_ids = None
+
+    def __len__(self) -> int:
+        return len(self.price)
+
+    def string(self, string_id: int):
+        """
+        Decode a string of the string table
+        @param string_id: id of the string
+        @return: the string, None for NO_STRING
+        """
+        if string_id == NO_STRING:
+            return None
+        start, end = self.string_offsets[string_id], self.string_offsets[string_id + 1]
+        return bytes(self.strings[start:end]).decode("utf8")
+
+    def string_id(self, string: str) -> int:
+        """
+        Give the id of a string, the reverse table is built on the first call
+        @param string: the string
+        @return: id of the string, NO_STRING if it is not in the catalogue
+        """
+        if self.__string_ids is None:
+            self.__string_ids = {self.string(i): i for i in range(len(self.string_offsets) - 1)}
+        return self.__string_ids.get(string, NO_STRING)
+
+    def other_ingredients(self, index: int) -> list:
+        """
+        Give the ids of the other ingredients of an item
+        @param index: position of the item
+        @return: array of string ids
+        """
+        return self.other_ids[self.other_offsets[index]:self.other_offsets[index + 1]]
+
+    def item(self, index: int) -> dict:
+        """
+        Rebuild an item like in the items JSON file
+        @param index: position of the item
+        @return: the item
+        """
+        item = {
+            "source": self.sources[self.source[index]],
+            "name": self.string(self.name[index]),
+            "price_kg": float(self.price_kg[index]),
+            "price": float(self.price[index]),
+            "ingredient": self.string(self.ingredient[index]),
+        }
+        if self.link[index] != NO_STRING:
+            item["link"] = self.string(self.link[index])
+        item["other_ingredients"] = [self.string(i) for i in self.other_ingredients(index)]
+        return item
+
+    def __getitem__(self, index: int) -> dict:
+        return self.item(index)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self.item(index)
+
+
+def iter_items(items_path: str):
+    """
+    Give the items without loading them, from the catalogue when it is up to date with the JSON file
+    @param items_path: path to the items JSON file
+    @return: a PriceCatalogue, or a generator reading the items of the JSON file one by one
+    """
+    path = catalogue_path(items_path)
+    meta = os.path.join(path, FILENAME_META)
+    if os.path.exists(meta) and (not os.path.exists(items_path) or os.path.getmtime(meta) >= os.path.getmtime(items_path)):
+        return PriceCatalogue(path)
+    return read_records(items_path)
+
+
+def load_items(items_path: str):
+    """
+    Load the items, from the catalogue when it is up to date with the JSON file
+    @param items_path: path to the items JSON file
+    @return: a PriceCatalogue, or the list of the items read from the JSON file
+    """
+    items = iter_items(items_path)
+    if isinstance(items, PriceCatalogue):
+        return items
+    return list(items)
+
+
+def ingredient_index(items) -> dict:
+    """
+    Index the items by ingredient and source. For each ingredient, the first item of the source
+    having it as ingredient or in its other ingredients is kept, like when going through the list.
+    @param items: PriceCatalogue or list of the items
+    @return: dict from (ingredient name, source) to the position of the item
+    """
+    index = {}
+    if isinstance(items, PriceCatalogue):
+        # work on plain lists to avoid creating numpy scalars for each value
+        strings = [items.string(i) for i in range(len(items.string_offsets) - 1)]
+        sources = [items.sources[code] for code in items.source.tolist()]
+        ingredients = items.ingredient.tolist()
+        offsets = items.other_offsets.tolist()
+        other_ids = items.other_ids.tolist()
+        for position, source in enumerate(sources):
+            index.setdefault((strings[ingredients[position]], source), position)
+            for string_id in other_ids[offsets[position]:offsets[position + 1]]:
+                index.setdefault((strings[string_id], source), position)
+    else:
+        for position, item in enumerate(items):
+            index.setdefault((item["ingredient"], item["source"]), position)
+            for ingredient in item.get("other_ingredients", []):
+                index.setdefault((ingredient, item["source"]), position)
+    return index
+
+
+def item_prices(items, position: int) -> tuple:
+    """
+    Give the prices of an item without rebuilding the whole item
+    @param items: PriceCatalogue or list of the items
+    @param position: position of the item
+    @return: tuple with the price and the price per kg
+    """
+    if isinstance(items, PriceCatalogue):
+        return float(items.price[position]), float(items.price_kg[position])
+    return items[position]["price"], items[position]["price_kg"]
@@ -0,0 +1,144 @@
+# Copyright (c) 2023 Anthony Gugler, Florian Hofmann and Jérémy Jordan
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+File containing the fitted price clusters of the recipes, saved as a small JSON file.
+A recipe is put in the cluster of the nearest mean, so the clusters of a source are separated by the
+middles between consecutive means and a new cost is labelled with a binary search over these boundaries.
+"""
+
+__authors__ = "Anthony Gugler, Florian Hofmann, Jérémy Jordan"
+__date__ = "18.10.2026"
+
+import json
+import os
+import time
+from bisect import bisect_right
+
+import numpy as np
+
+from dataprocessing.kmeans1d import kmeans_1d
+
+# the clusters are fitted again after this time (in seconds)
+REFIT_INTERVAL = 7 * 24 * 3600
+# the clusters are fitted again when the mean squared distance of the costs to their cluster
+# increased by more than this ratio since the fit
+DRIFT_THRESHOLD = 0.25
+# name of the cluster field of the recipes for each source
+NAME_CLUSTERS = {"ALDI": "ALDI_cluster", "USP": "UPS_cluster"}
+
+
+class ClusterModel:
+
+    def __init__(self, sources: dict, fitted_at: float):
+        """
+        Constructor
+        @param sources: dict from the source to its clusters: {'means': [...], 'boundaries': [...], 'inertia': float,
+                        'ranges': [[min, max], ...], 'counts': [...]}
+        @param fitted_at: timestamp of the fit
+        """
+        self.sources: dict = sources
+        self.fitted_at: float = fitted_at
+
+    @classmethod
+    def fit(cls, prices_by_source: dict, nbr_cluster: int):
+        """
+        Fit the clusters of each source with the exact 1-D k-means
+        @param prices_by_source: dict from the source to the list of the costs of the recipes
+        @param nbr_cluster: number of clusters
+        @return: tuple with the model and a dict from the source to the cluster of each cost
+        """
+        sources = {}
+        labels_by_source = {}
+        for source, prices in prices_by_source.items():
+            prices = np.asarray(prices, dtype=np.float64)
+            labels, clusters = kmeans_1d(prices, nbr_cluster)
+            means = (np.bincount(labels, weights=prices, minlength=len(clusters))
+                     / np.maximum(np.bincount(labels, minlength=len(clusters)), 1))
+            sources[source] = {
+                "means": means.tolist(),
+                "boundaries": ((means[:-1] + means[1:]) / 2).tolist(),
+                "inertia": float(np.mean((prices - means[labels]) ** 2)) if len(prices) > 0 else 0.0,
+                "ranges": [[price_min, price_max] for price_min, price_max, _ in clusters],
+                "counts": [count for _, _, count in clusters],
+            }
+            labels_by_source[source] = labels
+        return cls(sources, time.time()), labels_by_source
+
+    @classmethod
+    def load(cls, path: str):
+        """
+        Load a saved model
+        @param path: path to the model file
+        @return: the model, None if it has not been saved yet
+        """
+        if not os.path.exists(path):
+            return None
+        with open(path, "r", encoding="utf8") as f:
+            data = json.load(f)
+        return cls(data["sources"], data["fitted_at"])
+
+    def save(self, path: str) -> None:
+        """
+        Save the model
+        @param path: path to the model file
+        """
+        with open(path, "w", encoding="utf8") as f:
+            json.dump({"fitted_at": self.fitted_at, "sources": self.sources}, f)
+
+    def assign(self, source: str, price: float) -> int:
+        """
+        Give the cluster of a cost, 0 is the lowest price
+        @param source: source of the cost
+        @param price: cost of the recipe
+        @return: the cluster
+        """
+        return bisect_right(self.sources[source]["boundaries"], price)
+
+    def drift(self, source: str, prices) -> float:
+        """
+        Measure how much the costs moved away from the clusters since the fit
+        @param source: source of the costs
+        @param prices: costs of the recipes
+        @return: relative increase of the mean squared distance of the costs to their cluster
+        """
+        prices = np.asarray(prices, dtype=np.float64)
+        if len(prices) == 0:
+            return 0.0
+        clusters = self.sources[source]
+        means = np.asarray(clusters["means"])
+        labels = np.searchsorted(np.asarray(clusters["boundaries"]), prices, side="right")
+        inertia = float(np.mean((prices - means[labels]) ** 2))
+        if clusters["inertia"] == 0:
+            return 0.0 if inertia == 0 else float("inf")
+        return inertia / clusters["inertia"] - 1
+
+    def needs_refit(self, prices_by_source: dict) -> bool:
+        """
+        Check if the clusters have to be fitted again: the model is too old or the costs drifted too much
+        @param prices_by_source: dict from the source to the list of the current costs of the recipes
+        @return: True if the clusters have to be fitted again
+        """
+        if time.time() - self.fitted_at > REFIT_INTERVAL:
+            return True
+        for source, prices in prices_by_source.items():
+            if source not in self.sources or self.drift(source, prices) > DRIFT_THRESHOLD:
+                return True
+        return False
@@ -29,21 +29,42 @@ OUTPUT_FILENAME_ALDI = "aldi_processed.json"
 OUTPUT_FILENAME_USP = "usp_processed.json"
 OUTPUT_FILENAME_MARMITON = "marmiton_distinct_ingredient.json"
 OUTPUT_FILENAME_ITEMS = "items_ingredient.json"
+OUTPUT_FILENAME_MATCH_CACHE = "items_match_cache.json"
 
+import hashlib
+import itertools
 import json
 import os
 
+from dataprocessing.automaton import AhoCorasick
+from dataprocessing.catalogue import CatalogueWriter, catalogue_path
+from dataprocessing.ingredient_matcher import IngredientMatcher, match_names
+from dataprocessing.jsonstream import read_records, write_records
+from dataprocessing.match_cache import MatchCache
+
 class DataProcesser:
     OUTPUT_PATH: str = "./../data/"
     SOURCE_MARMITON: str = "Marmiton"
     SOURCE_USP: str = "USP"
     SOURCE_ALDI: str = "ALDI"
 
-    def __init__(self):
+    def __init__(self, streaming: bool = False):
         """
         Constructor
+        @param streaming: True to write every output as JSON Lines, one record at a time,
+        so the memory used doesn't depend on the size of the files. JSON arrays are always accepted as input.
+        """
+        self.streaming = streaming
+
+    def __output_file(self, filename: str) -> str:
+        """
+        Give the path of an output file, with the .jsonl extension in streaming mode
+        @param filename: name of the output file
+        @return: path to the output file
         """
-        pass
+        if self.streaming:
+            filename = os.path.splitext(filename)[0] + ".jsonl"
+        return self.OUTPUT_PATH + filename
 
 
     def __convert_price_per_unit_to_kg(self, price_per_unit):
@@ -85,52 +106,61 @@ class DataProcesser:
         :param path_to_json: path to the json file with data scraped from aldi
         POST : json file with ingredient in a standard format
         """
-        with open(path_to_json, 'r', encoding='utf-8') as file:
-            data = json.load(file)
-        
-        new_data = []
+        count_input = 0
         seen = set()
 
-        for item in data:
-            price_kg = self.__convert_price_per_unit_to_kg(item.get("price_per_unit"))
-            # Do not include item if price_kg is None
-            if price_kg is not None:
-                price_kg = round(price_kg, 2)
-                new_item = {
-                    "source": self.SOURCE_ALDI,
-                    "name": item.get("name"),
-                    "price_kg": price_kg,
-                    "price": float(item.get("price")),
-                    "ingredient": "",
-                    "link": item.get("url"),
-                }
-                item_tuple = tuple(new_item.items())
-                if item_tuple not in seen:
-                    seen.add(item_tuple)
-                    new_data.append(new_item)
-
-        with open(self.OUTPUT_PATH + OUTPUT_FILENAME_ALDI, 'w', encoding='utf-8') as file:
-            json.dump(new_data, file, ensure_ascii=False, indent=4)
-        
-        print(f"Nombre d'éléments dans le fichier d'entrée : {len(data)}")
-        print(f"Nombre d'éléments dans le fichier de sortie (sans doublons): {len(new_data)}")
+        def items():
+            nonlocal count_input
+            for item in read_records(path_to_json):
+                count_input += 1
+                price_kg = self.__convert_price_per_unit_to_kg(item.get("price_per_unit"))
+                # Do not include item if price_kg is None
+                if price_kg is not None:
+                    price_kg = round(price_kg, 2)
+                    new_item = {
+                        "source": self.SOURCE_ALDI,
+                        "name": item.get("name"),
+                        "price_kg": price_kg,
+                        "price": float(item.get("price")),
+                        "ingredient": "",
+                        "link": item.get("url"),
+                    }
+                    # only the hash of the items already seen is kept
+                    item_hash = hashlib.sha1(repr(tuple(new_item.items())).encode("utf8")).digest()
+                    if item_hash not in seen:
+                        seen.add(item_hash)
+                        yield new_item
+
+        count_output = write_records(self.__output_file(OUTPUT_FILENAME_ALDI), items(), self.streaming,
+                                     ensure_ascii=False, indent=4)
+
+        print(f"Nombre d'éléments dans le fichier d'entrée : {count_input}")
+        print(f"Nombre d'éléments dans le fichier de sortie (sans doublons): {count_output}")
 
     def clean_aldi_data(self, path_to_json: str) -> None:
         """
         This method removes duplicates from Aldi data and saves cleaned data to a new file
         :param path_to_json: path to the json file with data scraped from Aldi
         """
-        with open(path_to_json, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+        count_input = 0
+        seen = set()
 
-        # Remove duplicates (assuming that your data is a list of dictionaries)
-        cleaned_data = list({json.dumps(d, sort_keys=True): d for d in data}.values())
+        # Remove duplicates (assuming that your data is a list of dictionaries), only the hash of the records is kept
+        def cleaned_data():
+            nonlocal count_input
+            for d in read_records(path_to_json):
+                count_input += 1
+                d_hash = hashlib.sha1(json.dumps(d, sort_keys=True).encode("utf8")).digest()
+                if d_hash not in seen:
+                    seen.add(d_hash)
+                    yield d
 
         # Save cleaned data
-        with open(path_to_json.replace('.json', '_clean.json'), 'w', encoding='utf-8') as f:
-            json.dump(cleaned_data, f)
+        path, extension = os.path.splitext(path_to_json)
+        output_path = path + ('_clean.jsonl' if self.streaming else '_clean' + extension)
+        count_output = write_records(output_path, cleaned_data(), self.streaming)
 
-        print(f"Removed {len(data) - len(cleaned_data)} duplicates from Aldi data.")
+        print(f"Removed {count_input - count_output} duplicates from Aldi data.")
 
 
     def parse_usp(self, path_to_json: str) -> None:
@@ -139,216 +169,190 @@ class DataProcesser:
         :param path_to_json: path to the json file with data scraped from "USP"
         POST : json file with ingredient in a standard format
         """
-        # load the json file to dict
-        f = open(path_to_json, encoding='utf-8')
-        usp = json.load(f)
-        output: [] = []
-        for i in usp:
-            # --- Delete useless data ---
-            # check for price null
-            if i["price"] is None:
-                continue
-            if "/" in i["quantity"]:
-                continue
-            # create the ingredient with the standard format
-            ingredient: {} = {"source": self.SOURCE_USP, "name": i["name"], "price": -1, "ingredient": ""}
-            # strip the quantity and the price
-            i['quantity'] = i['quantity'].strip()
-            i['price'] = i['price'].strip()
-            # compute price
-            price: float = 0.0
-            tmp = str(i["price"]).split(" ")
-            # check if price has no space
-            if len(tmp) == 1:
-                try:
-                    price = float(tmp[0])
-                except Exception:
-                    # split on -
-                    tmp2 = tmp[0].split("-")
-                    price = (float(tmp2[0]) + float(tmp2[1])) / 2
-            elif len(tmp) == 3:
-                price = (float(tmp[0]) + float(tmp[2])) / 2.0
-            # compute price per kg
-            if i['quantity'] == "kg":
-                ingredient['price_kg'] = price
-            elif i['quantity'] == "g":
-                ingredient['price_kg'] = price * 1000
-            elif i['quantity'] == "Litre" or i['quantity'] == "l":
-                ingredient['price_kg'] = price
-            elif "g" in i['quantity']:
-                # extract the number of g
-                tmp = float(i['quantity'].split("g")[0])
-                ingredient['price_kg'] = (price/tmp)*1000
-            elif "dl" in i['quantity']:
-                # extract the number of g
-                tmp = float(i['quantity'].split("dl")[0])
-                ingredient['price_kg'] = (price/tmp)*10
-            elif "l" in i['quantity']:
-                # extract the number of g
-                tmp = float(i['quantity'].split("l")[0])
-                ingredient['price_kg'] = (price/tmp)
-            else:
-                ingredient['price_kg'] = -1.0
-
-            # append to list
-            output.append(ingredient)
+        # read the json file one record at a time
+        def output():
+            for i in read_records(path_to_json):
+                ingredient = self.__parse_usp_item(i)
+                if ingredient is not None:
+                    yield ingredient
 
         # write to file
-        outfile = open(self.OUTPUT_PATH + OUTPUT_FILENAME_USP, "w", encoding='utf8')
-        json.dump(output, outfile, ensure_ascii=False)
-        outfile.close()
+        write_records(self.__output_file(OUTPUT_FILENAME_USP), output(), self.streaming, ensure_ascii=False)
+
+    def __parse_usp_item(self, i: dict):
+        """
+        Put an item scraped from the "USP" in the standard format
+        :param i: the item scraped
+        :return: the item in the standard format, None if it has no use
+        """
+        # --- Delete useless data ---
+        # check for price null
+        if i["price"] is None:
+            return None
+        if "/" in i["quantity"]:
+            return None
+        # create the ingredient with the standard format
+        ingredient: {} = {"source": self.SOURCE_USP, "name": i["name"], "price": -1, "ingredient": ""}
+        # strip the quantity and the price
+        i['quantity'] = i['quantity'].strip()
+        i['price'] = i['price'].strip()
+        # compute price
+        price: float = 0.0
+        tmp = str(i["price"]).split(" ")
+        # check if price has no space
+        if len(tmp) == 1:
+            try:
+                price = float(tmp[0])
+            except Exception:
+                # split on -
+                tmp2 = tmp[0].split("-")
+                price = (float(tmp2[0]) + float(tmp2[1])) / 2
+        elif len(tmp) == 3:
+            price = (float(tmp[0]) + float(tmp[2])) / 2.0
+        # compute price per kg
+        if i['quantity'] == "kg":
+            ingredient['price_kg'] = price
+        elif i['quantity'] == "g":
+            ingredient['price_kg'] = price * 1000
+        elif i['quantity'] == "Litre" or i['quantity'] == "l":
+            ingredient['price_kg'] = price
+        elif "g" in i['quantity']:
+            # extract the number of g
+            tmp = float(i['quantity'].split("g")[0])
+            ingredient['price_kg'] = (price/tmp)*1000
+        elif "dl" in i['quantity']:
+            # extract the number of g
+            tmp = float(i['quantity'].split("dl")[0])
+            ingredient['price_kg'] = (price/tmp)*10
+        elif "l" in i['quantity']:
+            # extract the number of g
+            tmp = float(i['quantity'].split("l")[0])
+            ingredient['price_kg'] = (price/tmp)
+        else:
+            ingredient['price_kg'] = -1.0
+
+        return ingredient
 
         
-    def parse_marmiton(self, path_to_marmiton_json: str) -> None:
+    def parse_marmiton(self, path_to_marmiton_json: str, workers: int = 1, use_cache: bool = True) -> None:
         """
         This method process the data scraped from marmiton
         :param path_to_json: path to the json file with data scraped from marmiton
+        :param workers: number of processes used to match the items with the ingredients
+        :param use_cache: reuse the matches of the previous run for the items whose name didn't change
         POST : json file with ingredient in a standard format
         """
-        # Load the input JSON file
-        with open(path_to_marmiton_json, encoding="utf8") as f:
-            data_marmiton = json.load(f)
-
-        # Extract all the ingredients from each line
-        ingredients = []
-        for line in data_marmiton:
+        # Extract all the distinct ingredients from each line of the input JSON file
+        ingredients_name_list = set()
+        for line in read_records(path_to_marmiton_json):
             for ingredient in line["ingredients"]:
-                ingredients.append(ingredient)
-                
-                
-        ingredients_name_list = [d["name"] for d in ingredients]
+                ingredients_name_list.add(ingredient["name"])
 
-        ingredients_name_list_sorted = sorted(set(ingredients_name_list))
+        ingredients_name_list_sorted = sorted(ingredients_name_list)
 
         print("Le nombre d'ingrédient 'différents' est de : "+str(len(ingredients_name_list_sorted)))
             
         # Save the unique ingredients to a new JSON file
-        outfile = open(self.OUTPUT_PATH + OUTPUT_FILENAME_MARMITON, "w", encoding='utf8')
-        json.dump(ingredients_name_list_sorted, outfile, ensure_ascii=False)
-        outfile.close()
-
-        # get the full list of items from aldi and ups into a single list
-        with open(self.OUTPUT_PATH+OUTPUT_FILENAME_USP, encoding="utf8") as f:
-            data_ups = json.load(f)
-        with open(self.OUTPUT_PATH+OUTPUT_FILENAME_ALDI, encoding="utf8") as f:
-            data_aldi = json.load(f)
-
-        data_items = data_ups + data_aldi
-        
-        print("Le nombre d'item aldi est de : "+str(len(data_aldi)))
-        print("Le nombre d'item usp est de : "+str(len(data_ups)))
-        print("Le nombre d'item total dans la liste est de : "+str(len(data_items)))
+        write_records(self.__output_file(OUTPUT_FILENAME_MARMITON), ingredients_name_list_sorted, self.streaming,
+                      ensure_ascii=False)
+
+        # get the full list of items from aldi and ups, in streaming mode the files are read again when needed
+        def read_items():
+            return itertools.chain(read_records(self.__output_file(OUTPUT_FILENAME_USP)),
+                                   read_records(self.__output_file(OUTPUT_FILENAME_ALDI)))
+        if not self.streaming:
+            data_items = list(read_items())
+            read_items = lambda: data_items
+
+        # the items and the affiliations already computed with the same ingredients are reused.
+        # only the key of the items is kept in memory, the items with the same name are matched once.
+        cache = MatchCache(self.OUTPUT_PATH + OUTPUT_FILENAME_MATCH_CACHE if use_cache else None, ingredients_name_list_sorted)
+        keys = {}
+        to_match = {}
+        count_sources = {self.SOURCE_ALDI: 0, self.SOURCE_USP: 0}
+        for item in read_items():
+            count_sources[item["source"]] = count_sources.get(item["source"], 0) + 1
+            key = MatchCache.key(IngredientMatcher.normalize(item["name"]))
+            keys[key] = None
+            if key not in cache.items:
+                to_match[key] = item["name"]
+        count_items = sum(count_sources.values())
+
+        print("Le nombre d'item aldi est de : "+str(count_sources[self.SOURCE_ALDI]))
+        print("Le nombre d'item usp est de : "+str(count_sources[self.SOURCE_USP]))
+        print("Le nombre d'item total dans la liste est de : "+str(count_items))
         
         print("\n############### Le traitement a commencé ###############")
 
-        # for each item, check the full name of the item and check if there is a match in ingredient.
-        # if there is a match, add the ingredient to the item under it's ingredient field
-        # if there is no match, remove the last word and check again.
-        count = 0
-        for item in data_items:
-
-            # check the progress and display how many item has been processed
-            count += 1
-            if count % 500 == 0:
-                print("Nombre d'item traité est : "+str(count)+" sur "+str(len(data_aldi)+len(data_ups)))
+        print("Le nombre d'item déjà traité (cache) est de : "+str(count_items-len(to_match)))
 
-            item_name = item["name"]
-            
-            # change uppercase to lowercase
-            item_name = item_name.lower()
-
-            # remove any special characters from the name
-            item_name = item_name.replace(",", "")
-            item_name = item_name.replace(".", "")
-            item_name = item_name.replace(";", "")
-            item_name = item_name.replace(":", "")
-            item_name = item_name.replace("!", "")
-            item_name = item_name.replace("?", "")
-            item_name = item_name.replace("(", "")
-            item_name = item_name.replace(")", "")
-            item_name = item_name.replace("[", "")
-            item_name = item_name.replace("]", "")
-            item_name = item_name.replace("{", "")
-            item_name = item_name.replace("}", "")
-            item_name = item_name.replace("-", "")
-            item_name = item_name.replace("_", "")
-            item_name = item_name.replace("=", "")
-            item_name = item_name.replace("+", "")
-            item_name = item_name.replace("*", "")
-            item_name = item_name.replace("/", "")
-            item_name = item_name.replace("\\", "")
-            item_name = item_name.replace("|", "")
-            item_name = item_name.replace("@", "")
-            item_name = item_name.replace("#", "")
-
-            # Go through all ingredient and check the item's name match the ingredient name.
-            # if it doesn't match, the item's name is shortened by removing the last word and check again.
-            # if the item's name doesn't match any ingredient, it go through the list of ingredient again but the ingredient is shorten as well
-            for i in range(6):
-                for ingredient in ingredients_name_list_sorted:
-                    ingredient_name_tocheck = ingredient
-                    if i!=0:
-                        ingredient_name_tocheck = " ".join(ingredient_name_tocheck.split(" ")[:-i])
-                    if ingredient_name_tocheck == "":
-                        continue
-                    item_name_tocheck = item_name
-
-                    while item_name_tocheck != "":
-                        if ingredient_name_tocheck in item_name_tocheck:
-                            item["ingredient"] = ingredient
-                            break
-                        else:
-                            item_name_tocheck = " ".join(item_name_tocheck.split(" ")[:-1])
-                    if item_name_tocheck != "":
-                        break
-                if item["ingredient"] != "":
-                    break
-            
-            other_ingredients = []
-            
-            # Check if the ingredient has other one that can be affiliate (like carotte, there is also "carotte rapé") 
-            if item["ingredient"] != "":
-                for ingredient in ingredients_name_list_sorted:
-                    if item["ingredient"] in ingredient:
-                        if item["ingredient"] != ingredient:
-                            other_ingredients.append(ingredient)
-                            
-            item["other_ingredients"] = other_ingredients
-            
-        print("############### Le traitement est terminé ###############\n")
+        # for each new item, check the full name of the item and check if there is a match in ingredient.
+        # if there is a match, add the ingredient to the item under it's ingredient field
+        # if there is no match, shorten the ingredients and check again (see IngredientMatcher).
+        if len(to_match) > 0:
+            matcher = IngredientMatcher(ingredients_name_list_sorted)
+            count = 0
+            for key, ingredient in zip(to_match, match_names(matcher, list(to_match.values()), workers)):
+
+                # check the progress and display how many item has been processed
+                count += 1
+                if count % 500 == 0:
+                    print("Nombre d'item traité est : "+str(count)+" sur "+str(len(to_match)))
+
+                # the name is normalized and the first ingredient contained in it is kept.
+                # if there is none, the ingredients are shortened by removing their last word and checked again.
+                cache.items[key] = ingredient
+
+        # Check if the ingredient has other one that can be affiliate (like carotte, there is also "carotte rapé").
+        # All the ingredients newly matched are searched at once in every ingredient with an automaton,
+        # the list of the ingredients containing each of them is kept in sorted order.
+        matched_ingredients = sorted({cache.items[key] for key in keys if cache.items[key] != ""})
+        new_ingredients = [ingredient for ingredient in matched_ingredients if ingredient not in cache.affiliations]
+        if len(new_ingredients) > 0:
+            automaton = AhoCorasick(new_ingredients)
+            containing = {ingredient: [] for ingredient in new_ingredients}
+            for ingredient in ingredients_name_list_sorted:
+                for index in automaton.search(ingredient):
+                    if new_ingredients[index] != ingredient:
+                        containing[new_ingredients[index]].append(ingredient)
+            cache.affiliations.update(containing)
+
+        other_affiliated = set()
+        for ingredient in matched_ingredients:
+            other_affiliated.update(cache.affiliations[ingredient])
+
+        cache.save(list(keys), matched_ingredients)
 
         # count the number of item in the list where the ingredient field is not empty
         count_item = 0
-        for i in data_items:
-            if i["ingredient"] == "":
-                count_item += 1
+        catalogue = CatalogueWriter(catalogue_path(self.__output_file(OUTPUT_FILENAME_ITEMS)))
+
+        def affiliated_items():
+            nonlocal count_item
+            for item in read_items():
+                item["ingredient"] = cache.items[MatchCache.key(IngredientMatcher.normalize(item["name"]))]
+                item["other_ingredients"] = list(cache.affiliations.get(item["ingredient"], []))
+                if item["ingredient"] == "":
+                    count_item += 1
+                catalogue.add(item)
+                yield item
+
+        # Save the list of items affiliated (or not) to an ingredient to a new JSON file,
+        # and the same list in the columnar catalogue read by the price calculators
+        write_records(self.__output_file(OUTPUT_FILENAME_ITEMS), affiliated_items(), self.streaming, ensure_ascii=False)
+        catalogue.save()
+
+        print("############### Le traitement est terminé ###############\n")
 
         print("Le nombre d'item qui n'est pas affilié à un ingrédent est : "+str(count_item))
 
         # count the number of ingredient that doesn't have an item to liked with
-        count_ingredient = 0
-        count_other_ingredient = 0
-        for ingredient in ingredients_name_list_sorted:
-            for i in data_items:
-                if ingredient == i["ingredient"]:
-                    count_ingredient += 1
-                    break
-                    
-        #for ingredient in ingredients_name_list_sorted:
-        #    for i in data_items:
-        #        if ingredient in i["other_ingredients"]:
-        #            count_other_ingredient += 1
-        #            break
-        #                
+        count_ingredient = len(matched_ingredients)
+        count_other_ingredient = len(other_affiliated - set(matched_ingredients))
         print("Le nombre d'ingrédient qui possède une affiliation principal  (ingredient) : "+str(count_ingredient))
-        #print("Le nombre d'ingrédient qui possède une affiliation secondaire (other_ingredients) : "+str(count_other_ingredient))
+        print("Le nombre d'ingrédient qui possède une affiliation secondaire (other_ingredients) : "+str(count_other_ingredient))
         print("Le nombre d'ingrédient qui n'a pas d'item affilié est : "+str(len(ingredients_name_list_sorted)-count_ingredient-count_other_ingredient))
 
-        # Save the list of items affiliated (or not) to an ingredient to a new JSON file
-        outfile = open(self.OUTPUT_PATH + OUTPUT_FILENAME_ITEMS, "w", encoding='utf8')
-        json.dump(data_items, outfile, ensure_ascii=False)
-        outfile.close()
-
 
 def main():
     # test
@@ -0,0 +1,147 @@
+# Copyright (c) 2023 Anthony Gugler, Florian Hofmann and Jérémy Jordan
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+File containing the engine matching a store item to a marmiton ingredient
+"""
+
+__authors__ = "Anthony Gugler, Florian Hofmann, Jérémy Jordan"
+__date__ = "18.10.2026"
+
+import multiprocessing
+
+# special characters removed from the item's name before matching
+SPECIAL_CHARACTERS = ",.;:!?()[]{}-_=+*/\\|@#"
+# number of names sent at once to a worker process
+CHUNK_SIZE = 250
+
+# matcher of the worker processes, inherited from the parent when the processes are forked
+_worker_matcher = None
+
+
+class IngredientMatcher:
+    # number of times the ingredient's name is shortened by its last word
+    NBR_PASS: int = 6
+
+    def __init__(self, ingredients_name_list_sorted: list):
+        """
+        Constructor, build one prefix table per pass over the sorted ingredients.
+        The table of the pass i maps the ingredient's name without its i last words
+        to the position of the first ingredient giving this name.
+        @param ingredients_name_list_sorted: sorted list of the distinct ingredients
+        """
+        self.ingredients = ingredients_name_list_sorted
+        self.__prefix_tables: list = []
+        self.__max_lengths: list = []
+        for i in range(self.NBR_PASS):
+            table: dict = {}
+            for index, ingredient in enumerate(ingredients_name_list_sorted):
+                prefix = ingredient
+                if i != 0:
+                    prefix = " ".join(prefix.split(" ")[:-i])
+                if prefix != "" and prefix not in table:
+                    table[prefix] = index
+            self.__prefix_tables.append(table)
+            self.__max_lengths.append(max(map(len, table), default=0))
+
+    @staticmethod
+    def normalize(item_name: str) -> str:
+        """
+        Put the item's name in lowercase and remove any special characters
+        @param item_name: name of the item
+        @return: the normalized name
+        """
+        return item_name.lower().translate(str.maketrans("", "", SPECIAL_CHARACTERS))
+
+    def match(self, item_name: str) -> str:
+        """
+        Find the ingredient of an item. The result is the same as checking for each pass every
+        ingredient in sorted order, shortened by one more word at each pass, and keeping the first
+        one contained in the item's name (shortening the item's name never gives a new match since
+        it stays a prefix of the full name).
+        Instead of going through all the ingredients, every substring of the item's name is looked up
+        in the prefix table of the pass and only the ingredients found this way are compared.
+        @param item_name: normalized name of the item
+        @return: the ingredient matching the item or "" if there is none
+        """
+        substrings: set = set()
+        length = len(item_name)
+        max_length = max(self.__max_lengths)
+        for start in range(length):
+            for end in range(start + 1, min(length, start + max_length) + 1):
+                substrings.add(item_name[start:end])
+
+        for table in self.__prefix_tables:
+            candidates = [table[s] for s in substrings if s in table]
+            if len(candidates) > 0:
+                return self.ingredients[min(candidates)]
+        return ""
+
+
+def _init_worker(matcher=None) -> None:
+    """
+    Initialize a worker process with the matcher, only needed when it is not inherited
+    @param matcher: the matcher to use in the worker
+    """
+    global _worker_matcher
+    if matcher is not None:
+        _worker_matcher = matcher
+
+
+def _match_chunk(names: list) -> list:
+    """
+    Match a chunk of item's names in a worker process
+    @param names: names of the items
+    @return: list of the ingredients matched, in the same order
+    """
+    return [_worker_matcher.match(_worker_matcher.normalize(name)) for name in names]
+
+
+def match_names(matcher: IngredientMatcher, names: list, workers: int = 1):
+    """
+    Generator matching the item's names, in parallel when more than one worker is asked.
+    The names are split in chunks sent to a pool of processes, the matcher is shipped only once
+    to each process (inherited with fork, or given when the process starts otherwise).
+    @param matcher: the matcher to use
+    @param names: names of the items
+    @param workers: number of processes to use
+    @return: yield the ingredient matched for each name, in the same order as the names
+    """
+    global _worker_matcher
+    if workers <= 1:
+        for name in names:
+            yield matcher.match(matcher.normalize(name))
+        return
+
+    chunks = [names[i:i + CHUNK_SIZE] for i in range(0, len(names), CHUNK_SIZE)]
+    if "fork" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("fork")
+        _worker_matcher = matcher
+        initargs = ()
+    else:
+        context = multiprocessing.get_context()
+        initargs = (matcher,)
+    try:
+        with context.Pool(workers, initializer=_init_worker, initargs=initargs) as pool:
+            # imap keeps the order of the chunks whatever the process finishing first
+            for result in pool.imap(_match_chunk, chunks):
+                yield from result
+    finally:
+        _worker_matcher = None
@@ -0,0 +1,157 @@
+# Copyright (c) 2023 Anthony Gugler, Florian Hofmann and Jérémy Jordan
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+File containing functions to read and write records one by one in JSON files
+"""
+
+__authors__ = "Anthony Gugler, Florian Hofmann, Jérémy Jordan"
+__date__ = "18.10.2026"
+
+import json
+import re
+
+# size of the blocks read from the files
+CHUNK_SIZE = 65536
+
+_SEPARATORS = re.compile(r"[\s,]*")
+_WHITESPACE = re.compile(r"\s*")
+_COLON = re.compile(r"\s*:\s*")
+
+
+def read_records(path: str):
+    """
+    Generator reading the records of a JSON file one by one.
+    The file can be a JSON array (like the files written by scrapy) or JSON Lines.
+    @param path: path to the file
+    @return: yield each record of the file
+    """
+    with open(path, encoding="utf8") as f:
+        # look for the first character to know the format of the file
+        first = ""
+        while first == "":
+            chunk = f.read(CHUNK_SIZE)
+            if chunk == "":
+                return
+            first = chunk.lstrip()[:1]
+        f.seek(0)
+
+        if first == "[":
+            yield from _read_array(f)
+        else:
+            for line in f:
+                if line.strip() != "":
+                    yield json.loads(line)
+
+
+def read_items(path: str):
+    """
+    Generator reading the members of a JSON object one by one (like the recipe costs file)
+    @param path: path to the file
+    @return: yield a tuple with the key and the value of each member of the object
+    """
+    decoder = json.JSONDecoder()
+
+    def decode_member(buffer, position):
+        key, end = decoder.raw_decode(buffer, position)
+        colon = _COLON.match(buffer, end)
+        if not isinstance(key, str) or colon is None:
+            raise json.JSONDecodeError("Expecting ':' delimiter", buffer, end)
+        value, end = decoder.raw_decode(buffer, colon.end())
+        return (key, value), end
+
+    with open(path, encoding="utf8") as f:
+        yield from _read_container(f, "}", decode_member)
+
+
+def _read_array(f):
+    """
+    Generator decoding the elements of a JSON array without loading the whole file
+    @param f: file opened on the array
+    @return: yield each element of the array
+    """
+    yield from _read_container(f, "]", json.JSONDecoder().raw_decode)
+
+
+def _read_container(f, closing: str, decode):
+    """
+    Generator decoding the elements of a JSON array or object without loading the whole file
+    @param f: file opened on the container
+    @param closing: character closing the container
+    @param decode: function decoding an element from a buffer and a position, giving the element and its end
+    @return: yield each element of the container
+    """
+    buffer = ""
+    position = 0
+    eof = False
+    started = False
+    while True:
+        position = _SEPARATORS.match(buffer, position).end()
+        if position < len(buffer):
+            if not started:
+                # skip the opening bracket or brace
+                started = True
+                position += 1
+                continue
+            if buffer[position] == closing:
+                return
+            try:
+                record, end = decode(buffer, position)
+                # a number at the end of the buffer might be cut ("0." of "0.1"), the element is complete
+                # once the separator or the end of the container is read
+                following = _WHITESPACE.match(buffer, end).end()
+                if eof or (following < len(buffer) and buffer[following] in ("," + closing)):
+                    yield record
+                    position = end
+                    continue
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+        elif eof:
+            raise json.JSONDecodeError("Unterminated " + ("array" if closing == "]" else "object"), buffer, position)
+
+        # read the next block and drop what has already been decoded
+        chunk = f.read(CHUNK_SIZE)
+        eof = chunk == ""
+        buffer = buffer[position:] + chunk
+        position = 0
+
+
+def write_records(path: str, records, jsonl: bool, **kwargs) -> int:
+    """
+    Write records to a JSON file
+    @param path: path to the file
+    @param records: iterable of the records
+    @param jsonl: True to write one record per line as they come (JSON Lines), False to write a JSON array
+    @param kwargs: options given to json.dump when writing a JSON array
+    @return: the number of records written
+    """
+    with open(path, "w", encoding="utf8") as f:
+        if not jsonl:
+            records = list(records)
+            json.dump(records, f, **kwargs)
+            return len(records)
+
+        count = 0
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False))
+            f.write("\n")
+            count += 1
+        return count
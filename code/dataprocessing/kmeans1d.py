@@ -0,0 +1,114 @@
+# Copyright (c) 2023 Anthony Gugler, Florian Hofmann and Jérémy Jordan
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+File containing the exact k-means of one-dimensional values.
+The values are sorted, so each cluster is an interval and the optimal clustering is found by dynamic
+programming over the intervals. The start of the last cluster only moves to the right when the end moves
+to the right, so each row of the table is filled by divide and conquer in O(n log n).
+"""
+
+__authors__ = "Anthony Gugler, Florian Hofmann, Jérémy Jordan"
+__date__ = "18.10.2026"
+
+import numpy as np
+
+
+def _fill_row(previous: np.ndarray, first: int, cost) -> tuple:
+    """
+    Fill a row of the table: the cost of the best clustering of the values up to j with one more cluster
+    @param previous: best cost of the values up to j with one cluster less
+    @param first: first value that can start the last cluster (one value per cluster before)
+    @param cost: function giving the cost of the clusters [i, j] for an array of i and one j
+    @return: tuple with the costs of the row and the start of the last cluster for each j
+    """
+    n = len(previous)
+    row = np.full(n, np.inf)
+    starts = np.zeros(n, dtype=np.int64)
+    stack = [(first, n - 1, first, n - 1)]
+    while len(stack) > 0:
+        low, high, start_low, start_high = stack.pop()
+        if low > high:
+            continue
+        j = (low + high) // 2
+        candidates = np.arange(start_low, min(j, start_high) + 1)
+        costs = previous[candidates - 1] + cost(candidates, j)
+        best = int(np.argmin(costs))
+        row[j] = costs[best]
+        starts[j] = candidates[best]
+        stack.append((low, j - 1, start_low, starts[j]))
+        stack.append((j + 1, high, starts[j], start_high))
+    return row, starts
+
+
+def kmeans_1d(values, nbr_cluster: int) -> tuple:
+    """
+    Cluster one-dimensional values with the exact k-means, the result is always the same.
+    The clusters are numbered by increasing value, so the cluster 0 has the lowest values.
+    Equal values are always in the same cluster, there are less clusters than asked when there are
+    not enough distinct values.
+    @param values: iterable of the values
+    @param nbr_cluster: number of clusters
+    @return: tuple with the array of the cluster of each value and the list of the clusters
+             as (min, max, count), in the order of the clusters
+    """
+    values = np.asarray(list(values), dtype=np.float64)
+    if len(values) == 0:
+        return np.zeros(0, dtype=np.int64), []
+    distinct, inverse, weights = np.unique(values, return_inverse=True, return_counts=True)
+    n = len(distinct)
+    k = max(1, min(nbr_cluster, n))
+
+    # prefix sums of the weights, the values and their squares (centered to keep the precision)
+    centered = distinct - np.average(distinct, weights=weights)
+    sum_w = np.concatenate(([0.0], np.cumsum(weights, dtype=np.float64)))
+    sum_x = np.concatenate(([0.0], np.cumsum(weights * centered)))
+    sum_xx = np.concatenate(([0.0], np.cumsum(weights * centered * centered)))
+
+    def cost(i, j):
+        # sum of the squared distances to the mean of the values [i, j]
+        w = sum_w[j + 1] - sum_w[i]
+        s = sum_x[j + 1] - sum_x[i]
+        return np.maximum(sum_xx[j + 1] - sum_xx[i] - s * s / w, 0.0)
+
+    # starts[m][j] is the start of the last cluster of the best clustering of [0, j] in m + 1 clusters
+    row = cost(np.zeros(n, dtype=np.int64), np.arange(n))
+    starts = [np.zeros(n, dtype=np.int64)]
+    for m in range(1, k - 1):
+        row, row_starts = _fill_row(row, m, cost)
+        starts.append(row_starts)
+    if k > 1:
+        # only the clustering of all the values is needed in the last row
+        candidates = np.arange(k - 1, n)
+        row_starts = np.zeros(n, dtype=np.int64)
+        row_starts[n - 1] = candidates[int(np.argmin(row[candidates - 1] + cost(candidates, n - 1)))]
+        starts.append(row_starts)
+
+    # go back through the table to find the bounds of the clusters
+    labels_distinct = np.empty(n, dtype=np.int64)
+    clusters = []
+    end = n - 1
+    for m in range(k - 1, -1, -1):
+        start = int(starts[m][end])
+        labels_distinct[start:end + 1] = m
+        clusters.append((float(distinct[start]), float(distinct[end]), int(weights[start:end + 1].sum())))
+        end = start - 1
+    clusters.reverse()
+    return labels_distinct[inverse], clusters
@@ -0,0 +1,93 @@
+# Copyright (c) 2023 Anthony Gugler, Florian Hofmann and Jérémy Jordan
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+File containing the persistent cache of the matches between items and ingredients
+"""
+
+__authors__ = "Anthony Gugler, Florian Hofmann, Jérémy Jordan"
+__date__ = "18.10.2026"
+
+import hashlib
+import json
+import os
+
+
+class MatchCache:
+
+    def __init__(self, path: str, ingredients_name_list_sorted: list):
+        """
+        Constructor, load the cache if it has been built with the same ingredients.
+        When the ingredients changed, the cache starts empty and every item is matched again.
+        @param path: path to the cache file, None to keep the cache in memory only
+        @param ingredients_name_list_sorted: sorted list of the distinct ingredients
+        """
+        self.path = path
+        self.vocabulary: str = self.fingerprint(ingredients_name_list_sorted)
+        # ingredient matched for the hash of each item's name
+        self.items: dict = {}
+        # ingredients containing each ingredient matched
+        self.affiliations: dict = {}
+
+        if path is None or not os.path.exists(path):
+            return
+        with open(path, encoding="utf8") as f:
+            data = json.load(f)
+        if data.get("vocabulary") == self.vocabulary:
+            self.items = data["items"]
+            self.affiliations = data["affiliations"]
+
+    @staticmethod
+    def fingerprint(ingredients_name_list_sorted: list) -> str:
+        """
+        Compute the fingerprint of the ingredients vocabulary
+        @param ingredients_name_list_sorted: sorted list of the distinct ingredients
+        @return: hexadecimal hash
+        """
+        digest = hashlib.sha1()
+        for ingredient in ingredients_name_list_sorted:
+            digest.update(ingredient.encode("utf8"))
+            digest.update(b"\n")
+        return digest.hexdigest()
+
+    @staticmethod
+    def key(normalized_name: str) -> str:
+        """
+        Compute the key of an item from its normalized name
+        @param normalized_name: name of the item once normalized
+        @return: hexadecimal hash
+        """
+        return hashlib.sha1(normalized_name.encode("utf8")).hexdigest()
+
+    def save(self, keys: list, ingredients: list) -> None:
+        """
+        Save the cache, only the entries still in use are kept
+        @param keys: keys of the items of the current run
+        @param ingredients: ingredients matched during the current run
+        """
+        if self.path is None:
+            return
+        data = {
+            "vocabulary": self.vocabulary,
+            "items": {key: self.items[key] for key in keys},
+            "affiliations": {ingredient: self.affiliations[ingredient] for ingredient in ingredients},
+        }
+        with open(self.path, "w", encoding="utf8") as f:
+            json.dump(data, f, ensure_ascii=False)
@@ -0,0 +1,245 @@
+# Copyright (c) 2023 Anthony Gugler, Florian Hofmann and Jérémy Jordan
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+File containing the mini-batch k-means of the recipes on several features.
+The costs and the recipes are read one by one into a memory-mapped matrix of features, the centers are
+updated batch after batch and the recipes are labelled by chunks in parallel, so the memory used doesn't
+depend on the size of the JSON files.
+"""
+
+__authors__ = "Anthony Gugler, Florian Hofmann, Jérémy Jordan"
+__date__ = "18.10.2026"
+
+import hashlib
+import os
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from dataprocessing.cluster_model import NAME_CLUSTERS
+from dataprocessing.jsonstream import read_items, read_records, write_records
+
+# features of a recipe, the costs first
+FEATURES = ("ALDI", "USP", "price_range", "ingredients", "servings")
+FILENAME_FEATURES = "recipe_features.npy"
+# number of recipes used for one update of the centers
+BATCH_SIZE = 4096
+# maximum number of passes over the recipes
+NBR_EPOCH = 10
+# the passes stop when the centers moved less than this
+TOLERANCE = 1e-4
+# number of rows processed at once when scaling or labelling the recipes
+CHUNK_SIZE = 65536
+
+
+def _digest(name: str) -> bytes:
+    return hashlib.sha1(name.encode("utf8")).digest()
+
+
+def _number(value) -> float:
+    """
+    Convert a field of a recipe to a number
+    @param value: the field, like "3"
+    @return: the number, nan if the field is missing or not a number
+    """
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def build_features(path_cost: str, path_recipes: str, path_features: str) -> tuple:
+    """
+    Build the matrix of the features of the recipes having a cost, one row per recipe in the order of the costs
+    @param path_cost: path to the recipe costs JSON file
+    @param path_recipes: path to the recipes JSON file
+    @param path_features: path to the .npy file holding the matrix
+    @return: tuple with the memory-mapped matrix and the dict from the hash of the recipe name to its row
+    """
+    rows = {}
+    costs = {source: array("d") for source in NAME_CLUSTERS}
+    for name, cost in read_items(path_cost):
+        rows[_digest(name)] = len(rows)
+        for source in NAME_CLUSTERS:
+            costs[source].append(cost[source]["quantity_price"])
+
+    features = np.lib.format.open_memmap(path_features, mode="w+", dtype=np.float64, shape=(len(rows), len(FEATURES)))
+    for column, source in enumerate(NAME_CLUSTERS):
+        features[:, column] = np.frombuffer(costs[source], dtype=np.float64)
+    features[:, len(NAME_CLUSTERS):] = np.nan
+    # the last recipe with the same name wins, like for the costs
+    for recipe in read_records(path_recipes):
+        row = rows.get(_digest(recipe["name"]))
+        if row is not None:
+            features[row, len(NAME_CLUSTERS):] = (_number(recipe.get("price_range")), len(recipe["ingredients"]),
+                                                   _number(recipe.get("servings_quantity")))
+    return features, rows
+
+
+def standardize(features) -> tuple:
+    """
+    Scale the features in place to a mean of 0 and a standard deviation of 1, the missing values get the mean
+    @param features: matrix of the features
+    @return: tuple with the means and the standard deviations of the features
+    """
+    total = np.zeros(features.shape[1])
+    total_squares = np.zeros(features.shape[1])
+    count = np.zeros(features.shape[1])
+    for start in range(0, len(features), CHUNK_SIZE):
+        chunk = np.asarray(features[start:start + CHUNK_SIZE])
+        present = ~np.isnan(chunk)
+        chunk = np.where(present, chunk, 0)
+        total += chunk.sum(axis=0)
+        total_squares += (chunk * chunk).sum(axis=0)
+        count += present.sum(axis=0)
+    means = total / np.maximum(count, 1)
+    stds = np.sqrt(np.maximum(total_squares / np.maximum(count, 1) - means * means, 0))
+    stds[stds == 0] = 1
+    for start in range(0, len(features), CHUNK_SIZE):
+        chunk = np.asarray(features[start:start + CHUNK_SIZE])
+        features[start:start + CHUNK_SIZE] = (np.where(np.isnan(chunk), means, chunk) - means) / stds
+    return means, stds
+
+
+def _nearest(points: np.ndarray, centers: np.ndarray) -> np.ndarray:
+    """
+    Give the nearest center of each point
+    @param points: matrix of the points
+    @param centers: matrix of the centers
+    @return: array of the index of the nearest center
+    """
+    distances = (centers * centers).sum(axis=1) - 2 * points @ centers.T
+    return np.argmin(distances, axis=1)
+
+
+def _init_centers(sample: np.ndarray, nbr_cluster: int, rng) -> np.ndarray:
+    """
+    Choose the first centers with k-means++ on a sample of the points
+    @param sample: matrix of the points of the sample
+    @param nbr_cluster: number of centers
+    @param rng: random generator
+    @return: matrix of the centers
+    """
+    centers = [sample[rng.integers(len(sample))]]
+    distances = ((sample - centers[0]) ** 2).sum(axis=1)
+    for _ in range(1, nbr_cluster):
+        total = distances.sum()
+        index = rng.choice(len(sample), p=distances / total) if total > 0 else rng.integers(len(sample))
+        centers.append(sample[index])
+        distances = np.minimum(distances, ((sample - sample[index]) ** 2).sum(axis=1))
+    return np.array(centers)
+
+
+def minibatch_kmeans(features, nbr_cluster: int, batch_size: int = BATCH_SIZE, nbr_epoch: int = NBR_EPOCH,
+                     seed: int = 0) -> np.ndarray:
+    """
+    Fit the centers with the mini-batch k-means, each center moves toward the points of the batch
+    with a step decreasing with the number of points it got
+    @param features: matrix of the scaled features
+    @param nbr_cluster: number of clusters
+    @param batch_size: number of recipes of a batch
+    @param nbr_epoch: maximum number of passes over the recipes
+    @param seed: seed of the random generator, the result is the same for the same seed
+    @return: matrix of the centers
+    """
+    rng = np.random.default_rng(seed)
+    n = len(features)
+    nbr_cluster = min(nbr_cluster, n)
+    sample = np.asarray(features[np.sort(rng.choice(n, size=min(n, max(batch_size, 10 * nbr_cluster)), replace=False))])
+    centers = _init_centers(sample, nbr_cluster, rng)
+    counts = np.zeros(nbr_cluster)
+
+    for _ in range(nbr_epoch):
+        previous = centers.copy()
+        # the batches are contiguous rows to read the file sequentially, their order changes at each pass
+        for start in rng.permutation(np.arange(0, n, batch_size)):
+            batch = np.asarray(features[start:start + batch_size])
+            labels = _nearest(batch, centers)
+            batch_counts = np.bincount(labels, minlength=nbr_cluster)
+            sums = np.zeros_like(centers)
+            np.add.at(sums, labels, batch)
+            counts += batch_counts
+            updated = batch_counts > 0
+            centers[updated] += (sums[updated] - batch_counts[updated, None] * centers[updated]) / counts[updated, None]
+        if np.abs(centers - previous).max() < TOLERANCE:
+            break
+    return centers
+
+
+def assign_labels(features, centers: np.ndarray, workers: int = None) -> np.ndarray:
+    """
+    Label every recipe with its nearest center, the chunks are labelled in parallel
+    @param features: matrix of the scaled features
+    @param centers: matrix of the centers
+    @param workers: number of threads, all the cores by default
+    @return: array of the cluster of each recipe
+    """
+    starts = range(0, len(features), CHUNK_SIZE)
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+        chunks = list(executor.map(lambda start: _nearest(np.asarray(features[start:start + CHUNK_SIZE]), centers), starts))
+    return np.concatenate(chunks) if len(chunks) > 0 else np.zeros(0, dtype=np.int64)
+
+
+def cluster_recipes(path_cost: str, path_recipes: str, path_recipes_output: str, nbr_cluster: int,
+                    workers: int = None, batch_size: int = BATCH_SIZE) -> dict:
+    """
+    Cluster the recipes on all their features and write them with their clusters.
+    The clusters are ranked by the mean cost of each source, so the recipes get an ALDI_cluster and an
+    UPS_cluster going from 0 for the cheapest like the clusters of each source alone.
+    @param path_cost: path to the recipe costs JSON file
+    @param path_recipes: path to the recipes JSON file
+    @param path_recipes_output: path to the recipes with their clusters (JSON Lines if it ends with .jsonl)
+    @param nbr_cluster: number of clusters
+    @param workers: number of threads used to label the recipes, all the cores by default
+    @param batch_size: number of recipes of a batch
+    @return: dict from the cluster to its size and its center in the units of the features
+    """
+    path_features = os.path.join(os.path.dirname(path_recipes_output), FILENAME_FEATURES)
+    features, rows = build_features(path_cost, path_recipes, path_features)
+    try:
+        if len(features) == 0:
+            return {}
+        means, stds = standardize(features)
+        centers = minibatch_kmeans(features, nbr_cluster, batch_size)
+        labels = assign_labels(features, centers, workers)
+    finally:
+        del features
+        os.remove(path_features)
+
+    # rank of each cluster by the cost of each source
+    ranks = {}
+    for column, source in enumerate(NAME_CLUSTERS):
+        ranks[source] = np.argsort(np.argsort(centers[:, column], kind="stable"), kind="stable")
+
+    def labelled_recipes():
+        for recipe in read_records(path_recipes):
+            row = rows.get(_digest(recipe["name"]))
+            if row is not None:
+                for source, name_cluster in NAME_CLUSTERS.items():
+                    recipe[name_cluster] = int(ranks[source][labels[row]])
+            yield recipe
+
+    write_records(path_recipes_output, labelled_recipes(), path_recipes_output.endswith(".jsonl"), ensure_ascii=False)
+
+    sizes = np.bincount(labels, minlength=len(centers))
+    return {cluster: {"count": int(sizes[cluster]), "center": dict(zip(FEATURES, (centers[cluster] * stds + means).tolist()))}
+            for cluster in range(len(centers))}
@@ -0,0 +1,136 @@
+# Copyright (c) 2023 Anthony Gugler, Florian Hofmann and Jérémy Jordan
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+File containing the parser of the quantities of the marmiton ingredients.
+A quantity is a number (integer, decimal, fraction or mixed number like "1 1/2") followed by an optional unit,
+it is converted to kg. An empty quantity or an unknown unit (like "1 branche") is an invariant: the product
+is always purchased one time, its quantity is 0.
+"""
+
+__authors__ = "Anthony Gugler, Florian Hofmann, Jérémy Jordan"
+__date__ = "18.10.2026"
+
+import re
+from functools import lru_cache
+
+import numpy as np
+
+# unit codes
+UNIT_INVARIANT = 0
+UNIT_PIECE = 1
+UNIT_MASS = 2
+UNIT_VOLUME = 3
+UNIT_MEASURE = 4
+
+# weight to use when the quantity is in piece or there is no unit
+PIECE_KG = 0.2
+
+# known units with their code and their weight in kg
+UNITS = {
+    "mg": (UNIT_MASS, 0.000001),
+    "g": (UNIT_MASS, 0.001),
+    "gr": (UNIT_MASS, 0.001),
+    "gramme": (UNIT_MASS, 0.001),
+    "grammes": (UNIT_MASS, 0.001),
+    "kg": (UNIT_MASS, 1.0),
+    "ml": (UNIT_VOLUME, 0.001),
+    "cl": (UNIT_VOLUME, 0.01),
+    "dl": (UNIT_VOLUME, 0.1),
+    "l": (UNIT_VOLUME, 1.0),
+    "litre": (UNIT_VOLUME, 1.0),
+    "litres": (UNIT_VOLUME, 1.0),
+    "verre": (UNIT_MEASURE, 0.2),
+    "verres": (UNIT_MEASURE, 0.2),
+    "tasse": (UNIT_MEASURE, 0.24),
+    "tasses": (UNIT_MEASURE, 0.24),
+    "petite tasse": (UNIT_MEASURE, 0.1),
+    "petites tasses": (UNIT_MEASURE, 0.1),
+    "cuillère à soupe": (UNIT_MEASURE, 0.015),
+    "cuillères à soupe": (UNIT_MEASURE, 0.015),
+    "cuillère à café": (UNIT_MEASURE, 0.005),
+    "cuillères à café": (UNIT_MEASURE, 0.005),
+    "cuillère": (UNIT_MEASURE, 0.005),
+    "cuillères": (UNIT_MEASURE, 0.005),
+}
+
+# number then unit, the longest units are tried first so "petite tasse" wins over "tasse"
+_GRAMMAR = re.compile(
+    r"^(?:(?P<whole>\d+)\s+(?P<mixed_num>\d+)\s*/\s*(?P<mixed_den>\d+)"
+    r"|(?P<num>\d+(?:\.\d+)?)\s*/\s*(?P<den>\d+(?:\.\d+)?)"
+    r"|(?P<value>\d+(?:\.\d+)?))"
+    r"\s*(?P<unit>" + "|".join(re.escape(u) for u in sorted(UNITS, key=len, reverse=True)) + r")?"
+    r"\.?(?=\s|$)\s*(?P<rest>.*)$"
+)
+
+
+@lru_cache(maxsize=65536)
+def parse_quantity(quantity_str: str) -> tuple:
+    """
+    Parse the quantity of a recipe ingredient, the result is memoized since the same quantities come back a lot
+    @param quantity_str: quantity of the ingredient, like "250 g" or "1/2"
+    @return: tuple with the quantity in kg and the unit code
+    """
+    quantity_str = " ".join(quantity_str.replace("\xa0", " ").lower().split()).replace(",", ".")
+    match = _GRAMMAR.match(quantity_str)
+    if match is None:
+        return 0.0, UNIT_INVARIANT
+
+    # compute the number
+    if match.group("whole") is not None:
+        if float(match.group("mixed_den")) == 0:
+            return 0.0, UNIT_INVARIANT
+        number = float(match.group("whole")) + float(match.group("mixed_num")) / float(match.group("mixed_den"))
+    elif match.group("num") is not None:
+        if float(match.group("den")) == 0:
+            return 0.0, UNIT_INVARIANT
+        number = float(match.group("num")) / float(match.group("den"))
+    else:
+        number = float(match.group("value"))
+
+    # convert with the unit
+    if match.group("unit") is not None:
+        code, factor = UNITS[match.group("unit")]
+        return number * factor, code
+    if match.group("rest") == "":
+        return number * PIECE_KG, UNIT_PIECE
+    return 0.0, UNIT_INVARIANT  # unknown unit, consider as invariant
+
+
+def quantity_kg(quantity_str: str) -> float:
+    """
+    Give the quantity of a recipe ingredient in kg
+    @param quantity_str: quantity of the ingredient
+    @return: the quantity in kg, 0 for an invariant
+    """
+    return parse_quantity(quantity_str)[0]
+
+
+def parse_quantities(quantities) -> tuple:
+    """
+    Parse a whole column of quantities, each distinct quantity is parsed only once
+    @param quantities: iterable of the quantities of recipe ingredients
+    @return: tuple with the array of the quantities in kg (float64) and the array of the unit codes (int8)
+    """
+    distinct, inverse = np.unique(np.asarray(list(quantities), dtype=object).astype(str), return_inverse=True)
+    parsed = [parse_quantity(q) for q in distinct]
+    kg = np.fromiter((p[0] for p in parsed), dtype=np.float64, count=len(parsed))
+    codes = np.fromiter((p[1] for p in parsed), dtype=np.int8, count=len(parsed))
+    return kg[inverse], codes[inverse]
@@ -0,0 +1,158 @@
+# Copyright (c) 2023 Anthony Gugler, Florian Hofmann and Jérémy Jordan
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+File containing the asynchronous version of the price analysis used by the API,
+the requests to ElasticSearch don't block the event loop
+"""
+
+__authors__ = "Anthony Gugler, Florian Hofmann, Jérémy Jordan"
+__date__ = "18.10.2026"
+
+import asyncio
+
+from elasticsearch import AsyncElasticsearch
+
+from elasticdriver.backend import AsyncElasticsearchBackend, AsyncSearchBackend, SearchError
+from elasticdriver.elastic import ALIAS_ITEMS, ALIAS_RECIPES
+from elasticdriver.ingredient_cache import IngredientCache
+from elasticdriver.price_analysis import PriceAnalysis
+
+# number of recipes fetched together by price_recipes, the recipes of a batch are returned before the next one
+PRICE_BATCH = 100
+
+
+class AsyncPriceAnalysis:
+    def __init__(self, host='localhost', port=9200, scheme='http', user: str = 'user', password: str = 'password',
+                 client: AsyncElasticsearch = None, cache: IngredientCache = None, backend: AsyncSearchBackend = None):
+        if backend is None:
+            backend = AsyncElasticsearchBackend(client, host=host, port=port, scheme=scheme, user=user,
+                                                password=password)
+        self.backend = backend
+        # matches of the ingredients already looked up
+        self.cache = cache if cache is not None else IngredientCache()
+
+    async def close(self):
+        await self.backend.close()
+
+    async def get_price_from_ingredient_aldi(self, ingredient_name, index_name):
+        """
+        Get the price of the ingredient from the elastic search index only from aldi
+        :param ingredient_name: string
+        :param index_name: string
+        :return: List of Dicts, None when the search failed
+        """
+        return (await self.get_ingredient_matches([ingredient_name], index_name))[0]
+
+    async def current_generation(self, index_name):
+        """
+        Get the generation of an index, the version behind its alias, checked again from time to time
+        :param index_name: string
+        :return: string
+        """
+        generation = self.cache.generation(index_name)
+        if generation is None:
+            generation = await self.backend.generation(index_name)
+            self.cache.set_generation(index_name, generation)
+        return generation
+
+    async def get_ingredient_matches(self, names, price_index):
+        """
+        Get the best match and all the matches of each ingredient, from the cache or in one search of the backend
+        :param names: List of the ingredient names
+        :param price_index: string
+        :return: List of the matches of each ingredient, in the same order, None for the ingredients whose
+        search failed
+        """
+        generation = await self.current_generation(price_index)
+        matches, missing = PriceAnalysis.cached_matches(self.cache, generation, names)
+        if len(missing) > 0:
+            results = await self.backend.search_ingredients(missing, price_index)
+            PriceAnalysis.merge_matches(self.cache, generation, names, matches, missing, results)
+        return matches
+
+    async def search_recipe(self, query: str, recipe_index: str = ALIAS_RECIPES):
+        """
+        Find the recipe best matching a query
+        :param query: string
+        :param recipe_index: string
+        :return: Dict, None if no recipe matches
+        """
+        return await self.backend.search_recipe(query, recipe_index)
+
+    async def query_recipe(self, query: str, recipe_index: str = ALIAS_RECIPES, price_index=ALIAS_ITEMS):
+        best_match = await self.search_recipe(query, recipe_index)
+        if best_match is None or len(best_match['ingredients']) == 0:
+            return best_match
+        # the response materialized at the indexing is used while the items are the same
+        if best_match.get('price_generation') == await self.current_generation(price_index):
+            return best_match
+        PriceAnalysis.strip_materialized(best_match)
+        # query all the ingredients at once and keep the best match of each
+        names = [ingredient['name'] for ingredient in best_match['ingredients']]
+        return PriceAnalysis.build_recipe_response(best_match, await self.get_ingredient_matches(names, price_index))
+
+    async def query_recipes(self, queries: list, recipe_index: str = ALIAS_RECIPES, price_index=ALIAS_ITEMS):
+        """
+        Query several recipes concurrently
+        :param queries: List of strings
+        :param recipe_index: string
+        :param price_index: string
+        :return: List of Dicts in the same order as the queries, None for the queries without recipe
+        """
+        return await asyncio.gather(*(self.query_recipe(query, recipe_index, price_index) for query in queries))
+
+    async def price_recipes(self, queries: list = (), ids: list = (), recipe_index: str = ALIAS_RECIPES,
+                            price_index=ALIAS_ITEMS, batch_size: int = PRICE_BATCH):
+        """
+        Price several recipes found from a query or from their id, batch by batch: the recipes of a batch are
+        fetched with one msearch and one mget, then the distinct ingredients of the ones to price are searched
+        at once. The ingredients of the next batches are in the cache, so each one is only searched once
+        :param queries: List of strings
+        :param ids: List of the ids of the recipes
+        :param recipe_index: string
+        :param price_index: string
+        :param batch_size: int, number of recipes fetched together
+        :return: async generator of tuples with "query" or "id", the query or the id, the recipe (None when
+        it is not found or when its search failed) and the error of its search (None when it succeeded),
+        the recipes whose response is materialized come first
+        """
+        requests = [('query', query) for query in queries] + [('id', doc_id) for doc_id in ids]
+        for start in range(0, len(requests), batch_size):
+            batch = requests[start:start + batch_size]
+            # the queries come before the ids in the batch too
+            found_queries, found_ids = await asyncio.gather(
+                self.backend.search_recipes([key for kind, key in batch if kind == 'query'], recipe_index),
+                self.backend.get_documents(recipe_index, [key for kind, key in batch if kind == 'id']))
+            generation = await self.current_generation(price_index)
+            pending = []
+            for (kind, key), recipe in zip(batch, found_queries + found_ids):
+                if isinstance(recipe, SearchError):
+                    yield kind, key, None, str(recipe)
+                elif recipe is None or len(recipe['ingredients']) == 0 \
+                        or recipe.get('price_generation') == generation:
+                    yield kind, key, recipe, None
+                else:
+                    pending.append((kind, key, PriceAnalysis.strip_materialized(recipe)))
+            names = [ingredient['name'] for _, _, recipe in pending for ingredient in recipe['ingredients']]
+            matches = iter(await self.get_ingredient_matches(names, price_index))
+            for kind, key, recipe in pending:
+                yield kind, key, PriceAnalysis.build_recipe_response(
+                    recipe, [next(matches) for _ in recipe['ingredients']]), None
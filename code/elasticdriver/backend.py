@@ -0,0 +1,533 @@
+# Copyright (c) 2023 Anthony Gugler, Florian Hofmann and Jérémy Jordan
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+File containing the interface of the search backends used by the price analysis and the API.
+A backend finds the recipes and the items of the ingredients, and loads the documents of an index.
+The matches of an ingredient are a list with the best item and the hits (dicts with the item in "_source"),
+two empty lists when nothing matches and None when the search failed.
+"""
+
+__authors__ = "Anthony Gugler, Florian Hofmann, Jérémy Jordan"
+__date__ = "18.10.2026"
+
+from abc import ABC, abstractmethod
+
+from elasticsearch import AsyncElasticsearch, Elasticsearch
+from elasticsearch.exceptions import NotFoundError
+
+from elasticdriver.elastic import ElasticDriver, create_async_client, create_client
+
+# names of the backends, selected with the environment variable SEARCH_BACKEND
+BACKEND_ELASTICSEARCH = "elasticsearch"
+BACKEND_EMBEDDED = "embedded"
+# number of names suggested for a prefix, by default and at most
+SUGGEST_SIZE = 10
+SUGGEST_MAX_SIZE = 50
+# time given to Elasticsearch to complete a prefix, in seconds, the completion is typed live
+SUGGEST_TIMEOUT = 0.2
+
+
+def ingredient_query_aldi(ingredient_name: str) -> dict:
+    """
+    Build the search query of the prices of an ingredient only from aldi
+    @param ingredient_name: name of the ingredient
+    @return: the body of the search
+    """
+    return {
+        "query": {
+            "bool": {
+                "filter": [
+                    {"term": {"source": "ALDI"}}
+                ],
+                "should": [
+                    {"match": {"name": ingredient_name}},
+                    {"match": {"ingredient": ingredient_name}},
+                ]
+            }
+        }
+    }
+
+
+def item_query(ingredient_name: str) -> dict:
+    """
+    Build the search query of the items of an ingredient from all the sources
+    @param ingredient_name: name of the ingredient
+    @return: the body of the search
+    """
+    return {
+        "query": {
+            "bool": {
+                "should": [
+                    {"match": {"ingredient": ingredient_name}},
+                    {"match": {"other_ingredients": ingredient_name}}
+                ]
+            }
+        }
+    }
+
+
+def recipe_query(query: str) -> dict:
+    """
+    Build the search query of a recipe
+    @param query: the query of the user
+    @return: the body of the search
+    """
+    return {"query": {"match": {"name": query}}}
+
+
+class SearchError(Exception):
+    """
+    Failure of one search of a msearch or of one document of a mget, the others may have succeeded
+    """
+
+
+def search_error(res: dict) -> SearchError:
+    """
+    Give the error of a failed search of a msearch or of a failed document of a mget
+    @param res: the response of the search or of the document, with an "error" instead of the result
+    @return: SearchError
+    """
+    error = res['error']
+    if isinstance(error, dict):
+        error = error.get('reason') or error.get('type')
+    return SearchError(str(error))
+
+
+def found_sources(res: dict) -> list:
+    """
+    Give the documents of a mget
+    @param res: response of the mget
+    @return: the documents in the order of the ids, None for the ones not found, a SearchError for the ones
+    whose lookup failed
+    """
+    return [search_error(doc) if 'error' in doc else doc['_source'] if doc.get('found') else None
+            for doc in res['docs']]
+
+
+def suggest_query(prefix: str, size: int) -> dict:
+    """
+    Build the completion of the names of the recipes
+    @param prefix: the text typed
+    @param size: number of names returned
+    @return: the body of the search
+    """
+    return {
+        "_source": ["name"],
+        "suggest": {
+            "recipe": {"prefix": prefix, "completion": {"field": "suggest", "size": size}},
+        },
+    }
+
+
+def suggested_names(res: dict) -> list:
+    """
+    Give the names of the recipes completing a prefix
+    @param res: response of the completion
+    @return: the names, the most popular first
+    """
+    # the completion field is only set on the first recipe of each name, a name comes once
+    return [option["_source"]["name"] for option in res["suggest"]["recipe"][0]["options"]]
+
+
+def recipe_searches(queries: list, recipe_index: str) -> list:
+    """
+    Build the body of the msearch of several recipes
+    @param queries: the queries of the user
+    @param recipe_index: name of the index of the recipes
+    @return: list of the headers and the queries
+    """
+    searches = []
+    for query in queries:
+        searches.append({'index': recipe_index})
+        searches.append(recipe_query(query))
+    return searches
+
+
+def best_and_others(res: dict):
+    """
+    Split the response of a search of the prices of an ingredient
+    @param res: response of the search (or of one search of a msearch)
+    @return: list with the best match and all the matches, None if the search failed
+    """
+    if 'hits' not in res:
+        return None
+    # If no match found, return empty lists
+    if res['hits']['total']['value'] == 0:
+        return [[], []]
+    # Return best match and all other matches
+    return [res['hits']['hits'][0]['_source'], res['hits']['hits']]
+
+
+def ingredient_searches(names: list, price_index: str) -> list:
+    """
+    Build the body of the msearch of the prices of several ingredients
+    @param names: names of the ingredients
+    @param price_index: name of the index of the items
+    @return: list of the headers and the queries
+    """
+    searches = []
+    for name in names:
+        searches.append({'index': price_index})
+        searches.append(ingredient_query_aldi(name))
+    return searches
+
+
+def first_source(res: dict):
+    """
+    Give the document of the best hit of a search
+    @param res: response of the search (or of one search of a msearch)
+    @return: the document, None if there is no hit, a SearchError if the search of a msearch failed
+    """
+    if 'error' in res:
+        return search_error(res)
+    if res['hits']['total']['value'] == 0:
+        return None
+    return res['hits']['hits'][0]['_source']
+
+
+class SearchBackend(ABC):
+    # True when the indexed documents outlive the process
+    persistent = True
+
+    def __init__(self):
+        # functions called with the index and its new generation each time an index is loaded
+        self.listeners: list = []
+
+    @abstractmethod
+    def search_recipe(self, query: str, recipe_index: str):
+        """
+        Find the recipe best matching a query
+        @param query: the query of the user
+        @param recipe_index: name of the index of the recipes
+        @return: the recipe, None if no recipe matches
+        """
+
+    def search_recipes(self, queries: list, recipe_index: str) -> list:
+        """
+        Find the recipes best matching several queries
+        @param queries: the queries of the user
+        @param recipe_index: name of the index of the recipes
+        @return: the recipe of each query in the same order, None for the queries without recipe and
+        a SearchError for the searches that failed
+        """
+        return [self.search_recipe(query, recipe_index) for query in queries]
+
+    @abstractmethod
+    def search_ingredients(self, names: list, price_index: str) -> list:
+        """
+        Find the ALDI items of several ingredients
+        @param names: names of the ingredients
+        @param price_index: name of the index of the items
+        @return: the matches of each ingredient, in the same order
+        """
+
+    @abstractmethod
+    def search_items(self, ingredient_name: str, price_index: str) -> list:
+        """
+        Find the items of an ingredient from all the sources
+        @param ingredient_name: name of the ingredient
+        @param price_index: name of the index of the items
+        @return: the items, an empty list if nothing matches
+        """
+
+    @abstractmethod
+    def suggest(self, prefix: str, recipe_index: str, size: int = SUGGEST_SIZE) -> list:
+        """
+        Complete the name of a recipe, the price of the recipes is not looked up
+        @param prefix: the text typed
+        @param recipe_index: name of the index of the recipes
+        @param size: number of names returned
+        @return: the names of the recipes, the most popular first
+        """
+
+    @abstractmethod
+    def get_document(self, index_name: str, doc_id: str):
+        """
+        Give a document from its id
+        @param index_name: name of the index
+        @param doc_id: id of the document
+        @return: the document, None if it doesn't exist
+        """
+
+    def get_documents(self, index_name: str, doc_ids: list) -> list:
+        """
+        Give several documents from their id
+        @param index_name: name of the index
+        @param doc_ids: ids of the documents
+        @return: the documents in the same order, None for the ones that don't exist and a SearchError
+        for the ones whose lookup failed
+        """
+        return [self.get_document(index_name, doc_id) for doc_id in doc_ids]
+
+    @abstractmethod
+    def generation(self, index_name: str) -> str:
+        """
+        Give the generation of an index, it changes each time the index is loaded again
+        @param index_name: name of the index
+        @return: the generation
+        """
+
+    @abstractmethod
+    def index_data(self, index_name: str, file_path: str, fingerprint: str = None, progress=None):
+        """
+        Load the documents of a JSON data file in an index, the listeners are called once they are searchable
+        @param index_name: name of the index
+        @param file_path: path to the JSON data file
+        @param fingerprint: fingerprint of the data, kept with the index when it is persistent
+        @param progress: function called with the number of documents indexed from time to time
+        @return: tuple with the number of documents indexed and the number of failures
+        """
+
+    def is_current(self, index_name: str, fingerprint: str) -> bool:
+        """
+        Check if an index holds the data with a fingerprint
+        @param index_name: name of the index
+        @param fingerprint: fingerprint of the data
+        @return: True if the index doesn't need to be loaded again
+        """
+        return False
+
+    def create_snapshot(self, fingerprint: str, index_names: list) -> None:
+        """
+        Keep a copy of some indices to restore them instead of loading them again
+        @param fingerprint: fingerprint of the data of the indices
+        @param index_names: names of the indices
+        """
+
+    def restore_snapshot(self, fingerprint: str, index_names: list) -> bool:
+        """
+        Restore the copy of some indices holding the data with a fingerprint
+        @param fingerprint: fingerprint of the data
+        @param index_names: names of the indices
+        @return: True if the indices have been restored
+        """
+        return False
+
+    def async_backend(self):
+        """
+        Give the asynchronous backend searching the same indices
+        @return: AsyncSearchBackend
+        """
+        return AsyncBackendAdapter(self)
+
+    def close(self) -> None:
+        pass
+
+
+class AsyncSearchBackend(ABC):
+    """
+    Asynchronous version of the searches of a backend, used by the API
+    """
+
+    @abstractmethod
+    async def search_recipe(self, query: str, recipe_index: str):
+        pass
+
+    @abstractmethod
+    async def search_recipes(self, queries: list, recipe_index: str) -> list:
+        pass
+
+    @abstractmethod
+    async def search_ingredients(self, names: list, price_index: str) -> list:
+        pass
+
+    @abstractmethod
+    async def get_documents(self, index_name: str, doc_ids: list) -> list:
+        pass
+
+    @abstractmethod
+    async def suggest(self, prefix: str, recipe_index: str, size: int = SUGGEST_SIZE) -> list:
+        pass
+
+    @abstractmethod
+    async def generation(self, index_name: str) -> str:
+        pass
+
+    async def close(self) -> None:
+        pass
+
+
+class AsyncBackendAdapter(AsyncSearchBackend):
+    """
+    Asynchronous view of a backend running in the process, its searches don't wait for anything
+    """
+
+    def __init__(self, backend: SearchBackend):
+        self.backend = backend
+
+    async def search_recipe(self, query: str, recipe_index: str):
+        return self.backend.search_recipe(query, recipe_index)
+
+    async def search_recipes(self, queries: list, recipe_index: str) -> list:
+        return self.backend.search_recipes(queries, recipe_index)
+
+    async def search_ingredients(self, names: list, price_index: str) -> list:
+        return self.backend.search_ingredients(names, price_index)
+
+    async def get_documents(self, index_name: str, doc_ids: list) -> list:
+        return self.backend.get_documents(index_name, doc_ids)
+
+    async def suggest(self, prefix: str, recipe_index: str, size: int = SUGGEST_SIZE) -> list:
+        return self.backend.suggest(prefix, recipe_index, size)
+
+    async def generation(self, index_name: str) -> str:
+        return self.backend.generation(index_name)
+
+
+class ElasticsearchBackend(SearchBackend):
+
+    def __init__(self, client: Elasticsearch = None, **options):
+        """
+        Constructor
+        @param client: A client to share, the options are ignored when it is given
+        @param options: the options of create_client
+        """
+        super().__init__()
+        self.options = options
+        if client is None:
+            client = create_client(**options)
+        self.elastic = client
+        self.driver = ElasticDriver(client=client)
+        # the driver calls the listeners when it moves an alias
+        self.driver.listeners = self.listeners
+
+    def search_recipe(self, query: str, recipe_index: str):
+        return first_source(self.elastic.search(index=recipe_index, body=recipe_query(query)))
+
+    def search_recipes(self, queries: list, recipe_index: str) -> list:
+        if len(queries) == 0:
+            return []
+        responses = self.elastic.msearch(searches=recipe_searches(queries, recipe_index))['responses']
+        return [first_source(res) for res in responses]
+
+    def search_ingredients(self, names: list, price_index: str) -> list:
+        if len(names) == 0:
+            return []
+        responses = self.elastic.msearch(searches=ingredient_searches(names, price_index))['responses']
+        return [best_and_others(res) for res in responses]
+
+    def search_items(self, ingredient_name: str, price_index: str) -> list:
+        res = self.elastic.search(index=price_index, body=item_query(ingredient_name))
+        return [hit['_source'] for hit in res['hits']['hits']]
+
+    def suggest(self, prefix: str, recipe_index: str, size: int = SUGGEST_SIZE) -> list:
+        elastic = self.elastic.options(request_timeout=SUGGEST_TIMEOUT, max_retries=0)
+        return suggested_names(elastic.search(index=recipe_index, body=suggest_query(prefix, size)))
+
+    def get_document(self, index_name: str, doc_id: str):
+        try:
+            return self.elastic.get(index=index_name, id=doc_id)['_source']
+        except NotFoundError:
+            return None
+
+    def get_documents(self, index_name: str, doc_ids: list) -> list:
+        if len(doc_ids) == 0:
+            return []
+        return found_sources(self.elastic.mget(index=index_name, ids=doc_ids))
+
+    def generation(self, index_name: str) -> str:
+        try:
+            # the version behind the alias
+            return ','.join(sorted(self.elastic.indices.get_alias(name=index_name)))
+        except NotFoundError:
+            # not an alias
+            return index_name
+
+    def index_data(self, index_name: str, file_path: str, fingerprint: str = None, progress=None):
+        return self.driver.index_data(index_name, file_path, fingerprint=fingerprint, progress=progress)
+
+    def is_current(self, index_name: str, fingerprint: str) -> bool:
+        return self.driver.fingerprint(index_name) == fingerprint
+
+    def create_snapshot(self, fingerprint: str, index_names: list) -> None:
+        self.driver.create_snapshot(fingerprint, index_names)
+
+    def restore_snapshot(self, fingerprint: str, index_names: list) -> bool:
+        return self.driver.restore_snapshot(fingerprint, index_names)
+
+    def async_backend(self):
+        return AsyncElasticsearchBackend(create_async_client(**self.options))
+
+    def close(self) -> None:
+        self.elastic.close()
+
+
+class AsyncElasticsearchBackend(AsyncSearchBackend):
+
+    def __init__(self, client: AsyncElasticsearch = None, **options):
+        """
+        Constructor
+        @param client: A client to share, the options are ignored when it is given
+        @param options: the options of create_async_client
+        """
+        if client is None:
+            client = create_async_client(**options)
+        self.elastic = client
+
+    async def search_recipe(self, query: str, recipe_index: str):
+        return first_source(await self.elastic.search(index=recipe_index, body=recipe_query(query)))
+
+    async def search_recipes(self, queries: list, recipe_index: str) -> list:
+        if len(queries) == 0:
+            return []
+        res = await self.elastic.msearch(searches=recipe_searches(queries, recipe_index))
+        return [first_source(response) for response in res['responses']]
+
+    async def search_ingredients(self, names: list, price_index: str) -> list:
+        if len(names) == 0:
+            return []
+        res = await self.elastic.msearch(searches=ingredient_searches(names, price_index))
+        return [best_and_others(response) for response in res['responses']]
+
+    async def get_documents(self, index_name: str, doc_ids: list) -> list:
+        if len(doc_ids) == 0:
+            return []
+        return found_sources(await self.elastic.mget(index=index_name, ids=doc_ids))
+
+    async def suggest(self, prefix: str, recipe_index: str, size: int = SUGGEST_SIZE) -> list:
+        # no retry, the API completes the prefix without Elasticsearch when it doesn't answer right away
+        elastic = self.elastic.options(request_timeout=SUGGEST_TIMEOUT, max_retries=0)
+        return suggested_names(await elastic.search(index=recipe_index, body=suggest_query(prefix, size)))
+
+    async def generation(self, index_name: str) -> str:
+        try:
+            return ','.join(sorted(await self.elastic.indices.get_alias(name=index_name)))
+        except NotFoundError:
+            return index_name
+
+    async def close(self) -> None:
+        await self.elastic.close()
+
+
+def create_backend(name: str = BACKEND_ELASTICSEARCH, **options) -> SearchBackend:
+    """
+    Create a backend from its name
+    @param name: BACKEND_ELASTICSEARCH or BACKEND_EMBEDDED
+    @param options: the options of the client of Elasticsearch
+    @return: SearchBackend
+    """
+    if name == BACKEND_EMBEDDED:
+        # imported here, the embedded engine is built on the interface of this file
+        from elasticdriver.embedded import EmbeddedBackend
+        return EmbeddedBackend()
+    if name == BACKEND_ELASTICSEARCH:
+        return ElasticsearchBackend(**options)
+    raise ValueError(f"Unknown search backend: {name}")
@@ -25,13 +25,114 @@ File containing a indexer class for ElasticSearch
 __authors__ = "Anthony Gugler, Florian Hofmann, Jérémy Jordan"
 __date__ = "26.05.2023"
 
+import hashlib
 import json
-from elasticsearch import Elasticsearch
+import time
+
+from elasticsearch import ApiError, AsyncElasticsearch, Elasticsearch
+from elasticsearch.helpers import parallel_bulk
+from dataprocessing.catalogue import iter_items
+from elasticdriver.mappings import ANALYSIS, MAPPINGS_ITEMS, MAPPINGS_RECIPES, index_template
+
+# aliases queried by the API, each one points to the current version of its index
+ALIAS_ITEMS = 'items_ingredient'
+ALIAS_RECIPES = 'recipe_marmiton'
+# connection pool of the clients, shared by all the requests of the API
+CONNECTIONS_PER_NODE = 32
+REQUEST_TIMEOUT = 30
+MAX_RETRIES = 3
+# number of documents sent in one bulk request
+BULK_CHUNK_SIZE = 2000
+# number of threads sending the bulk requests
+BULK_THREAD_COUNT = 4
+# number of failed documents printed, the others are only counted
+MAX_FAILURES_REPORTED = 10
+# settings of an index while it is loaded, no refresh and no replica
+LOADING_SETTINGS = {'index': {'refresh_interval': '-1', 'number_of_replicas': 0}}
+# settings set back once the index is loaded (None resets a setting to its default)
+DEFAULT_SETTINGS = {'index': {'refresh_interval': None, 'number_of_replicas': None}}
+# the indices are versioned behind an alias: <alias>_v<timestamp in ms>
+VERSION_SEPARATOR = '_v'
+# number of versions kept, the previous one allows to go back
+KEEP_VERSIONS = 2
+# mappings of the versions of each index, put in an index template before loading a version
+MAPPINGS = {ALIAS_ITEMS: MAPPINGS_ITEMS, ALIAS_RECIPES: MAPPINGS_RECIPES}
+# field of the documents used to warm up a new index, for each alias
+WARMUP_FIELDS = {ALIAS_ITEMS: 'ingredient', ALIAS_RECIPES: 'name'}
+# number of queries run on a new index and gap between the documents they come from
+WARMUP_SIZE = 50
+WARMUP_STEP = 100
+# repository of the snapshots of the indices, in the data directory mounted in the container of Elasticsearch
+# (the location must be listed in the setting path.repo of the node)
+SNAPSHOT_REPOSITORY = 'recettes'
+SNAPSHOT_LOCATION = '/usr/share/elasticsearch/config/data/snapshots'
+# number of snapshots kept, one for each of the last fingerprints of the data
+KEEP_SNAPSHOTS = 2
+# size of the blocks read to compute the fingerprint of the data files
+FINGERPRINT_BLOCK = 1 << 20
+
+
+def data_fingerprint(*paths: str) -> str:
+    """
+    Compute the fingerprint of the data indexed: the content of the data files and the mappings of the indices
+
+    @param paths: paths to the data files
+    @return: the fingerprint, in hexadecimal
+    """
+    digest = hashlib.sha1(json.dumps([MAPPINGS, ANALYSIS], sort_keys=True).encode())
+    for path in paths:
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(FINGERPRINT_BLOCK), b''):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+def client_options(host: str = 'localhost', port: int = 9200, user: str = 'user', password: str = 'password',
+                   scheme: str = 'http') -> dict:
+    """
+    Options of the clients, with a connection pool sized for the concurrent requests of the API
+
+    @param host: The host of the ElasticSearch server
+    @param port: The port of the ElasticSearch server
+    @param user: The user
+    @param password: The password
+    @param scheme: The scheme to use for connecting to the ElasticSearch.
+    @return: dict of the options
+    """
+    return {
+        'hosts': [{'host': host, 'port': port, 'scheme': scheme}],
+        'basic_auth': (user, password),
+        'connections_per_node': CONNECTIONS_PER_NODE,
+        'request_timeout': REQUEST_TIMEOUT,
+        'max_retries': MAX_RETRIES,
+        'retry_on_timeout': True,
+    }
+
+
+def create_client(**kwargs) -> Elasticsearch:
+    """
+    Create a synchronous client, the parameters are the ones of client_options
+    """
+    return Elasticsearch(**client_options(**kwargs))
+
+
+def create_async_client(**kwargs) -> AsyncElasticsearch:
+    """
+    Create an asynchronous client, the parameters are the ones of client_options
+    """
+    return AsyncElasticsearch(**client_options(**kwargs))
+
+
+class IndexingError(Exception):
+    """
+    Failure of the load of a new version of an index, the version is deleted and the alias doesn't move
+    """
 
 
 class ElasticDriver:
 
-    def __init__(self, host: str='localhost', port: int=9200, user: str='user', password: str='password', scheme: str='http'):
+    def __init__(self, host: str='localhost', port: int=9200, user: str='user', password: str='password', scheme: str='http',
+                 client: Elasticsearch = None):
         """
         Constructor
 
@@ -40,38 +141,280 @@ class ElasticDriver:
         @param user: The user 
         @param password: The password 
         @param scheme: The scheme to use for connecting to the ElasticSearch.
+        @param client: A client to share, the other parameters are ignored when it is given
         all param have default value
         """
-        self.elastic = Elasticsearch(hosts=[{'host': host, 'port': port, 'scheme': scheme}], http_auth=(user, password))
+        if client is None:
+            client = create_client(host=host, port=port, user=user, password=password, scheme=scheme)
+        self.elastic = client
+        # functions called with the alias and the new version each time an alias is moved
+        self.listeners: list = []
 
-    def index_data(self, index_name: str, file_path: str):
+    def index_data(self, index_name: str, file_path: str, chunk_size: int = BULK_CHUNK_SIZE,
+                   thread_count: int = BULK_THREAD_COUNT, fingerprint: str = None, progress=None):
         """
-        Function to index JSON data file into index in ElasticSearch
+        Function to index JSON data file into index in ElasticSearch.
+        The documents are loaded in a new version of the index while the previous one is still queried,
+        then the alias is moved to the new version in one atomic action and the old versions are deleted.
+        The documents are read one by one and sent in bulk requests by several threads, the refresh and
+        the replicas are disabled during the load and set back to their default after.
+        When a document fails to be indexed, the new version is deleted and IndexingError is raised.
 
-        @param index_name: Name of the index
+        @param index_name: Name of the alias used to query the index
         @param file_path: Path to the JSON data file
+        @param chunk_size: Number of documents sent in one bulk request
+        @param thread_count: Number of threads sending the bulk requests
+        @param fingerprint: Fingerprint of the data, kept in the metadata of the index
+        @param progress: Function called with the number of documents indexed after each chunk
+        @return: tuple with the number of documents indexed and the number of failures, always 0
         """
+        version = f"{index_name}{VERSION_SEPARATOR}{int(time.time() * 1000)}"
+        self.put_template(index_name)
+        self.elastic.indices.create(index=version, settings=LOADING_SETTINGS)
 
-        # Check if the index already exists
-        if self.elastic.indices.exists(index=index_name):
-            # Delete the index if it exists
-            self.elastic.indices.delete(index=index_name)
-            print(f"Deleted existing index: {index_name}")
+        # Read the JSON data file one document at a time, or its columnar catalogue when there is one,
+        # and keep some values of the documents to warm up the new index
+        warmup_field = WARMUP_FIELDS.get(index_name, 'name')
+        warmup_values = []
 
-        # Open and load JSON data file
-        with open(file_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+        def actions():
+            for i, doc in enumerate(iter_items(file_path)):
+                if i % WARMUP_STEP == 0 and len(warmup_values) < WARMUP_SIZE and doc.get(warmup_field):
+                    warmup_values.append(doc[warmup_field])
+                yield {'_index': version, '_id': i, '_source': doc}
 
         # Index data into Elasticsearch
-        for i, doc in enumerate(data):
-            self.elastic.index(index=index_name, id=i, document=doc)
-        print("Data indexing completed")
+        start = time.perf_counter()
+        indexed = 0
+        failures = 0
+        try:
+            try:
+                for ok, info in parallel_bulk(self.elastic, actions(), thread_count=thread_count,
+                                              chunk_size=chunk_size, raise_on_error=False, raise_on_exception=False):
+                    if ok:
+                        indexed += 1
+                        if progress is not None and indexed % chunk_size == 0:
+                            progress(indexed)
+                        continue
+                    failures += 1
+                    if failures <= MAX_FAILURES_REPORTED:
+                        print(f"Failed to index a document: {info}")
+            finally:
+                # restore the settings, even when the load failed
+                self.elastic.indices.put_settings(index=version, settings=DEFAULT_SETTINGS)
+            if failures > 0:
+                # a partial index is never published, the previous version stays behind the alias
+                raise IndexingError(f"{failures} documents of {file_path} failed to be indexed in {version}")
+            # make the documents visible
+            self.elastic.indices.refresh(index=version)
+            # the fingerprint is only kept once the whole data is loaded, a partial index is never current
+            if fingerprint is not None:
+                self.elastic.indices.put_mapping(index=version, meta={'fingerprint': fingerprint})
+        except Exception:
+            # the failed version would be the newest one and push the previous one out of the versions kept
+            self.delete_version(version)
+            raise
+        elapsed = time.perf_counter() - start
+        print(f"Data indexing completed: {indexed} documents in {elapsed:.1f}s "
+              f"({indexed / max(elapsed, 1e-9):.0f} docs/s), {failures} failures")
+
+        if progress is not None:
+            progress(indexed)
+
+        self.warm_up(version, warmup_field, warmup_values)
+        self.publish(index_name, version)
+        return indexed, failures
+
+    def publish(self, alias: str, version: str):
+        """
+        Put a new version of an index behind its alias, tell the listeners and delete the old versions
+
+        @param alias: Name of the alias
+        @param version: Name of the new version
+        """
+        self.swap_alias(alias, version)
+        for listener in self.listeners:
+            listener(alias, version)
+        self.delete_old_versions(alias)
+
+    def put_template(self, alias: str):
+        """
+        Create or update the index template of the versions of an index, the indices without
+        known mappings keep the dynamic mapping
+
+        @param alias: Name of the alias
+        """
+        if alias in MAPPINGS:
+            self.elastic.indices.put_index_template(name=alias, **index_template(f"{alias}{VERSION_SEPARATOR}*", MAPPINGS[alias]))
+
+    def warm_up(self, index_name: str, field: str, values: list):
+        """
+        Run some queries on a new index so the first queries of the users don't hit a cold index
+
+        @param index_name: Name of the index
+        @param field: Field queried
+        @param values: Values searched in the field
+        """
+        if len(values) == 0:
+            return
+        searches = []
+        for value in values:
+            searches.append({'index': index_name})
+            searches.append({'query': {'match': {field: value}}})
+        self.elastic.msearch(searches=searches)
+
+    def swap_alias(self, alias: str, index_name: str):
+        """
+        Move the alias to an index in one atomic action.
+        An index with the name of the alias (indexed before the versions) is deleted in the same action.
+
+        @param alias: Name of the alias
+        @param index_name: Name of the index to put behind the alias
+        """
+        actions = []
+        if self.elastic.indices.exists_alias(name=alias):
+            for previous in self.elastic.indices.get_alias(name=alias):
+                actions.append({'remove': {'index': previous, 'alias': alias}})
+        elif self.elastic.indices.exists(index=alias):
+            actions.append({'remove_index': {'index': alias}})
+        actions.append({'add': {'index': index_name, 'alias': alias}})
+        self.elastic.indices.update_aliases(actions=actions)
+        print(f"Alias {alias} now points to {index_name}")
+
+    def delete_version(self, version: str):
+        """
+        Delete a version whose load failed, the error of the load is kept when the deletion fails too
+
+        @param version: Name of the version
+        """
+        try:
+            self.elastic.indices.delete(index=version)
+            print(f"Deleted the failed version {version}")
+        except Exception as e:
+            print(f"Failed to delete the failed version {version}: {e}")
+
+    def delete_old_versions(self, alias: str, keep: int = KEEP_VERSIONS):
+        """
+        Delete the oldest versions of an index, the one behind the alias is never deleted
+
+        @param alias: Name of the alias
+        @param keep: Number of versions kept, the current one included
+        """
+        versions = [name for name in self.elastic.indices.get(index=f"{alias}{VERSION_SEPARATOR}*")
+                    if name.rsplit(VERSION_SEPARATOR, 1)[1].isdigit()]
+        versions.sort(key=lambda name: int(name.rsplit(VERSION_SEPARATOR, 1)[1]), reverse=True)
+        current = set(self.elastic.indices.get_alias(name=alias)) if self.elastic.indices.exists_alias(name=alias) else set()
+        old = [version for version in versions[keep:] if version not in current]
+        if len(old) > 0:
+            self.elastic.indices.delete(index=",".join(old))
+            print(f"Deleted old versions: {', '.join(old)}")
+
+    def fingerprint(self, alias: str):
+        """
+        Give the fingerprint of the data of the version behind an alias
+
+        @param alias: Name of the alias
+        @return: the fingerprint, None if the index doesn't exist or has been indexed without fingerprint
+        """
+        if not self.elastic.indices.exists(index=alias):
+            return None
+        for body in self.elastic.indices.get_mapping(index=alias).values():
+            return body['mappings'].get('_meta', {}).get('fingerprint')
+        return None
+
+    @staticmethod
+    def snapshot_name(fingerprint: str) -> str:
+        """
+        Give the name of the snapshot of the data with a fingerprint
+
+        @param fingerprint: Fingerprint of the data
+        @return: the name of the snapshot
+        """
+        return f"data-{fingerprint[:16]}"
+
+    def create_repository(self) -> bool:
+        """
+        Register the repository of the snapshots
+
+        @return: True if the repository can be used
+        """
+        try:
+            self.elastic.snapshot.create_repository(name=SNAPSHOT_REPOSITORY, type='fs',
+                                                    settings={'location': SNAPSHOT_LOCATION})
+            return True
+        except ApiError as e:
+            print(f"Snapshot repository unavailable (is path.repo set?): {e}")
+            return False
+
+    def create_snapshot(self, fingerprint: str, aliases: list):
+        """
+        Snapshot the versions behind some aliases, the oldest snapshots are deleted
+
+        @param fingerprint: Fingerprint of the data of the versions
+        @param aliases: Names of the aliases
+        """
+        if not self.create_repository():
+            return
+        name = self.snapshot_name(fingerprint)
+        indices = [index for alias in aliases for index in self.elastic.indices.get_alias(name=alias)]
+        try:
+            self.elastic.snapshot.delete(repository=SNAPSHOT_REPOSITORY, snapshot=name)
+        except ApiError:
+            # no snapshot of this data yet
+            pass
+        self.elastic.snapshot.create(repository=SNAPSHOT_REPOSITORY, snapshot=name, indices=",".join(indices),
+                                     include_global_state=False, wait_for_completion=True,
+                                     metadata={'fingerprint': fingerprint})
+        print(f"Snapshot {name} created with {', '.join(indices)}")
+        self.delete_old_snapshots()
+
+    def restore_snapshot(self, fingerprint: str, aliases: list) -> bool:
+        """
+        Restore the versions of the snapshot of some data and put them behind their aliases
+
+        @param fingerprint: Fingerprint of the data
+        @param aliases: Names of the aliases
+        @return: True if the snapshot has been restored, False if there is no snapshot of the data
+        """
+        if not self.create_repository():
+            return False
+        name = self.snapshot_name(fingerprint)
+        try:
+            snapshot = self.elastic.snapshot.get(repository=SNAPSHOT_REPOSITORY, snapshot=name)['snapshots'][0]
+        except (ApiError, IndexError):
+            return False
+        versions = {alias: index for index in snapshot['indices'] for alias in aliases
+                    if index.startswith(f"{alias}{VERSION_SEPARATOR}")}
+        if len(versions) != len(aliases):
+            return False
+        # the versions keep their name, it is the generation the recipes have been materialized with,
+        # the ones still there hold the same documents and are not restored
+        missing = [version for version in versions.values() if not self.elastic.indices.exists(index=version)]
+        if len(missing) > 0:
+            self.elastic.snapshot.restore(repository=SNAPSHOT_REPOSITORY, snapshot=name, indices=",".join(missing),
+                                          include_global_state=False, include_aliases=False, wait_for_completion=True)
+        for alias, version in versions.items():
+            self.publish(alias, version)
+        print(f"Snapshot {name} restored")
+        return True
+
+    def delete_old_snapshots(self, keep: int = KEEP_SNAPSHOTS):
+        """
+        Delete the oldest snapshots of the repository
+
+        @param keep: Number of snapshots kept
+        """
+        snapshots = self.elastic.snapshot.get(repository=SNAPSHOT_REPOSITORY, snapshot='*')['snapshots']
+        snapshots.sort(key=lambda snapshot: snapshot.get('start_time_in_millis', 0), reverse=True)
+        for snapshot in snapshots[keep:]:
+            self.elastic.snapshot.delete(repository=SNAPSHOT_REPOSITORY, snapshot=snapshot['snapshot'])
+            print(f"Deleted old snapshot {snapshot['snapshot']}")
 
 
 if __name__ == "__main__":
     driver = ElasticDriver()
-    driver.index_data('recipe_marmiton', './data/recipe_marmiton_with_cluster.json')
-    driver.index_data('items_ingredient', './data/items_ingredient.json')
+    driver.index_data(ALIAS_RECIPES, './data/recipe_marmiton_with_cluster.json')
+    driver.index_data(ALIAS_ITEMS, './data/items_ingredient.json')
 
 
 
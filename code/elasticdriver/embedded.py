@@ -0,0 +1,406 @@
+# Copyright (c) 2023 Anthony Gugler, Florian Hofmann and Jérémy Jordan
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+File containing a search engine running in the process, used instead of ElasticSearch for the local runs,
+the tests and the small deployments.
+The text fields of the mappings are kept in an inverted index scored with BM25, like ElasticSearch does,
+and analyzed like the french_name analyzer (elisions, lower case, accents folded, stop words, light stemming).
+The names of the recipes are also kept sorted by prefix to complete them, ranked by their popularity.
+"""
+
+__authors__ = "Anthony Gugler, Florian Hofmann, Jérémy Jordan"
+__date__ = "18.10.2026"
+
+import bisect
+import copy
+import heapq
+import math
+import re
+import threading
+import time
+import unicodedata
+from collections import Counter
+
+from dataprocessing.catalogue import iter_items
+from elasticdriver.backend import SUGGEST_MAX_SIZE, SUGGEST_SIZE, SearchBackend, best_and_others
+from elasticdriver.elastic import ALIAS_ITEMS, ALIAS_RECIPES, VERSION_SEPARATOR
+from elasticdriver.mappings import FRENCH_TEXT, MAPPINGS_ITEMS, MAPPINGS_RECIPES
+
+# parameters of BM25, the defaults of ElasticSearch
+K1 = 1.2
+B = 0.75
+# number of hits returned by a search, the default size of ElasticSearch
+SEARCH_SIZE = 10
+# text fields indexed for each index, the others are kept in the documents only
+TEXT_FIELDS = {
+    alias: tuple(field for field, mapping in mappings["properties"].items() if mapping == FRENCH_TEXT)
+    for alias, mappings in ((ALIAS_ITEMS, MAPPINGS_ITEMS), (ALIAS_RECIPES, MAPPINGS_RECIPES))
+}
+# number of words of a name from which it can be completed, "tatin" completes "Tarte tatin"
+SUGGEST_INPUTS = 4
+# the best names of the prefixes matching more inputs than this are ranked once when the index is built
+SUGGEST_SCAN_LIMIT = 256
+# the weights of the completion field of ElasticSearch are integers
+MAX_WEIGHT = 2 ** 31 - 1
+ELISION = re.compile(r"\b(?:l|m|t|qu|n|s|j|d|c|jusqu|quoiqu|lorsqu|puisqu)['’]")
+TOKEN = re.compile(r"[^\W_]+")
+# French stop words, without their accents
+STOP_WORDS = frozenset("""
+a au aux avec ce ces dans de des du elle en et eux il je la le les leur lui ma mais me meme mes moi mon ne nos
+notre nous on ou par pas pour qu que qui sa se ses son sur ta te tes toi ton tu un une vos votre vous c d j l m n
+s t y ete etee etees etes etant suis es est sommes etes sont serai seras sera serons serez seront serais serait
+serions seriez seraient etais etait etions etiez etaient fus fut fumes futes furent sois soit soyons soyez soient
+fusse fusses fut fussions fussiez fussent ayant eu eue eues eus ai as avons avez ont aurai auras aura aurons aurez
+auront aurais aurait aurions auriez auraient avais avait avions aviez avaient eut eumes eutes eurent aie aies ait
+ayons ayez aient eusse eusses eut eussions eussiez eussent ceci cela cet cette ici ils les leurs quel quels quelle
+quelles sans soi
+""".split())
+
+
+def fold(text: str) -> str:
+    """
+    Remove the accents of a text and split its ligatures
+    @param text: the text
+    @return: the text in ASCII letters when possible
+    """
+    text = text.replace("œ", "oe").replace("æ", "ae")
+    return "".join(c for c in unicodedata.normalize("NFKD", text) if not unicodedata.combining(c))
+
+
+def stem(token: str) -> str:
+    """
+    Remove the plural and feminine endings of a token, a lighter version of the light_french stemmer
+    @param token: the token, in lower case and without accents
+    @return: the stem
+    """
+    if len(token) > 5 and token.endswith("aux"):
+        token = token[:-3] + "al"
+    elif len(token) > 3 and token[-1] in "sx":
+        token = token[:-1]
+    if len(token) > 4 and token[-1] == "e":
+        token = token[:-1]
+    return token
+
+
+def analyze(text: str) -> list:
+    """
+    Split a text in the terms of the index
+    @param text: the text
+    @return: the terms, in the order of the text
+    """
+    text = fold(ELISION.sub("", text.lower()))
+    return [stem(token) for token in TOKEN.findall(text) if token not in STOP_WORDS]
+
+
+def field_terms(value, analyzed: dict) -> list:
+    """
+    Give the terms of the value of a field, a list of texts is analyzed as one text
+    @param value: the value, a string or a list of strings
+    @param analyzed: terms of the texts already analyzed, the same texts come back in many documents
+    @return: the terms
+    """
+    if value is None:
+        return []
+    terms = []
+    for text in value if isinstance(value, list) else [value]:
+        text = str(text)
+        if text not in analyzed:
+            analyzed[text] = analyze(text)
+        terms.extend(analyzed[text])
+    return terms
+
+
+def suggestion_key(text: str) -> str:
+    """
+    Normalize a text like the suggest_name analyzer, the words in lower case without accents
+    @param text: a name or a prefix
+    @return: the words separated by a space
+    """
+    return " ".join(TOKEN.findall(fold(text.lower())))
+
+
+def suggestion_inputs(name: str) -> list:
+    """
+    Give the texts from which a name is completed, the name and the end of the name from its next words
+    @param name: the name of a recipe
+    @return: the texts, the name first
+    """
+    words = name.split()
+    starts = [0] + [i for i, word in enumerate(words) if i > 0 and suggestion_key(word) not in STOP_WORDS]
+    return [" ".join(words[start:]) for start in starts[:SUGGEST_INPUTS]]
+
+
+def popularity(names) -> dict:
+    """
+    Rank the names of the recipes by popularity. Marmiton lists a recipe in each category where it is popular
+    and sorts its listings by popularity, so a name scraped more often comes first, then the name scraped first
+    @param names: the names in the order they have been scraped, with their repetitions
+    @return: dict of the distinct names and their weight, the higher the more popular
+    """
+    counts = Counter()
+    for name in names:
+        if name:
+            counts[name] += 1
+    # the counter keeps the order in which the names have been seen first
+    return {name: min(count * len(counts) + len(counts) - rank, MAX_WEIGHT)
+            for rank, (name, count) in enumerate(counts.items())}
+
+
+def completion_field(name: str, weight: int) -> dict:
+    """
+    Build the value of the completion field of a recipe
+    @param name: the name of the recipe
+    @param weight: its popularity
+    @return: the inputs and the weight of the suggestions
+    """
+    return {"input": suggestion_inputs(name), "weight": weight}
+
+
+class PrefixIndex:
+
+    def __init__(self, weights: dict):
+        """
+        Constructor, sort the inputs of the names like a flattened trie: the inputs starting with a prefix follow
+        each other, and the best names of the prefixes matching many inputs are ranked in advance
+        @param weights: dict of the names and their popularity
+        """
+        entries = sorted({(suggestion_key(text), -weight, name)
+                          for name, weight in weights.items() for text in suggestion_inputs(name)})
+        entries = [entry for entry in entries if entry[0]]
+        self.__keys = [key for key, _, _ in entries]
+        self.__ranked = [(weight, name) for _, weight, name in entries]
+        # best names of the prefixes matching more than SUGGEST_SCAN_LIMIT inputs
+        self.__best: dict = {}
+        ranges = [(0, len(entries))]
+        length = 1
+        while len(ranges) > 0:
+            larger = []
+            for lo, hi in ranges:
+                start = lo
+                while start < hi:
+                    if len(self.__keys[start]) < length:
+                        # the prefix itself, it comes before the longer inputs
+                        start += 1
+                        continue
+                    prefix = self.__keys[start][:length]
+                    end = bisect.bisect_left(self.__keys, prefix + "\uffff", start, hi)
+                    if end - start > SUGGEST_SCAN_LIMIT:
+                        self.__best[prefix] = self.__rank(start, end)
+                        larger.append((start, end))
+                    start = end
+            ranges = larger
+            length += 1
+
+    def __len__(self):
+        return len(self.__keys)
+
+    def __rank(self, lo: int, hi: int) -> list:
+        # a name has several inputs starting with the same prefix, e.g. "tarte tatin" and "tatin" for "ta"
+        best = heapq.nsmallest(SUGGEST_MAX_SIZE * SUGGEST_INPUTS, self.__ranked[lo:hi])
+        return list(dict.fromkeys(name for _, name in best))[:SUGGEST_MAX_SIZE]
+
+    def suggest(self, prefix: str, size: int = SUGGEST_SIZE) -> list:
+        """
+        Complete a prefix
+        @param prefix: the text typed
+        @param size: number of names returned, at most SUGGEST_MAX_SIZE
+        @return: the most popular names with a word starting like the prefix
+        """
+        key = suggestion_key(prefix)
+        if not key:
+            return []
+        best = self.__best.get(key)
+        if best is None:
+            lo = bisect.bisect_left(self.__keys, key)
+            best = self.__rank(lo, bisect.bisect_left(self.__keys, key + "\uffff", lo))
+        return best[:size]
+
+
+class BM25Index:
+
+    def __init__(self, name: str, documents: list, fields: tuple):
+        """
+        Constructor, index the documents
+        @param name: name of the index, given in the hits
+        @param documents: the documents, their id is their position
+        @param fields: the text fields indexed
+        """
+        self.name = name
+        self.documents = documents
+        # ids of the documents kept by each filter already used
+        self.__filtered: dict = {}
+        # weight of each document for each term of each field, the BM25 score of the term in the document
+        self.__postings: dict = {}
+        analyzed = {}
+        for field in fields:
+            frequencies = {}
+            lengths = []
+            for doc_id, doc in enumerate(documents):
+                terms = field_terms(doc.get(field), analyzed)
+                lengths.append(len(terms))
+                for term, tf in Counter(terms).items():
+                    frequencies.setdefault(term, {})[doc_id] = tf
+            average = sum(lengths) / max(len(lengths), 1)
+            postings = {}
+            for term, counts in frequencies.items():
+                idf = math.log(1 + (len(documents) - len(counts) + 0.5) / (len(counts) + 0.5))
+                postings[term] = [
+                    (doc_id, idf * tf * (K1 + 1) / (tf + K1 * (1 - B + B * lengths[doc_id] / max(average, 1e-9))))
+                    for doc_id, tf in counts.items()
+                ]
+            self.__postings[field] = postings
+
+    def score(self, clauses: list) -> dict:
+        """
+        Score the documents matching at least one term of the clauses, the scores of the clauses are summed
+        @param clauses: list of tuples with the field and the text searched in it
+        @return: dict of the id of the documents and their score
+        """
+        scores = {}
+        for field, text in clauses:
+            postings = self.__postings.get(field, {})
+            for term in analyze(text):
+                for doc_id, weight in postings.get(term, ()):
+                    scores[doc_id] = scores.get(doc_id, 0.0) + weight
+        return scores
+
+    def search(self, clauses: list, filters: dict = None, size: int = SEARCH_SIZE) -> dict:
+        """
+        Search the documents, the response has the shape of the one of ElasticSearch
+        @param clauses: list of tuples with the field and the text searched in it
+        @param filters: dict of the fields and the exact value the documents must have, None for no filter
+        @param size: number of hits returned
+        @return: the response
+        """
+        scores = self.score(clauses)
+        total = len(scores)
+        if filters:
+            allowed, allowed_ids = self.filtered(filters)
+            scores = {doc_id: score for doc_id, score in scores.items() if doc_id in allowed_ids}
+            total = len(allowed)
+        best = heapq.nsmallest(size, scores, key=lambda doc_id: (-scores[doc_id], doc_id))
+        if filters and len(best) < size:
+            # with a filter the should clauses are optional, the documents only filtered come next with a score of 0
+            best += [doc_id for doc_id in allowed[:size + len(scores)] if doc_id not in scores][:size - len(best)]
+        return {
+            "hits": {
+                "total": {"value": total, "relation": "eq"},
+                "hits": [self.hit(doc_id, scores.get(doc_id, 0.0)) for doc_id in best],
+            }
+        }
+
+    def filtered(self, filters: dict) -> tuple:
+        """
+        Give the documents having the exact value of some fields
+        @param filters: dict of the fields and their value
+        @return: tuple with the ids of the documents in order and the set of these ids
+        """
+        key = tuple(sorted(filters.items()))
+        if key not in self.__filtered:
+            allowed = [doc_id for doc_id, doc in enumerate(self.documents)
+                       if all(doc.get(field) == value for field, value in key)]
+            self.__filtered[key] = (allowed, frozenset(allowed))
+        return self.__filtered[key]
+
+    def hit(self, doc_id: int, score: float = 1.0) -> dict:
+        """
+        Give a hit of a document, with a copy of the document whose fields can be set
+        @param doc_id: id of the document
+        @param score: score of the document
+        @return: the hit
+        """
+        # the values are shared with the index, only the recipes are modified in depth and they are copied
+        return {"_index": self.name, "_id": str(doc_id), "_score": score, "_source": dict(self.documents[doc_id])}
+
+
+class EmbeddedBackend(SearchBackend):
+    # the indices are lost when the process stops
+    persistent = False
+
+    def __init__(self):
+        """
+        Constructor, the indices are empty until index_data loads them
+        """
+        super().__init__()
+        self.__indices: dict = {}
+        self.__suggestions: dict = {}
+        self.__lock = threading.Lock()
+
+    def __index(self, index_name: str) -> BM25Index:
+        index = self.__indices.get(index_name)
+        if index is None:
+            raise ValueError(f"Index {index_name} is not loaded")
+        return index
+
+    def search_recipe(self, query: str, recipe_index: str):
+        res = self.__index(recipe_index).search([("name", query)], size=1)
+        if res["hits"]["total"]["value"] == 0:
+            return None
+        # the ingredients of the recipe get their matches
+        return copy.deepcopy(res["hits"]["hits"][0]["_source"])
+
+    def search_ingredients(self, names: list, price_index: str) -> list:
+        index = self.__index(price_index)
+        return [best_and_others(index.search([("name", name), ("ingredient", name)], filters={"source": "ALDI"}))
+                for name in names]
+
+    def search_items(self, ingredient_name: str, price_index: str) -> list:
+        res = self.__index(price_index).search([("ingredient", ingredient_name), ("other_ingredients", ingredient_name)])
+        return [hit["_source"] for hit in res["hits"]["hits"]]
+
+    def suggest(self, prefix: str, recipe_index: str, size: int = SUGGEST_SIZE) -> list:
+        suggestions = self.__suggestions.get(recipe_index)
+        if suggestions is None:
+            raise ValueError(f"Index {recipe_index} is not loaded")
+        return suggestions.suggest(prefix, size)
+
+    def get_document(self, index_name: str, doc_id: str):
+        index = self.__index(index_name)
+        if not str(doc_id).isdigit() or int(doc_id) >= len(index.documents):
+            return None
+        return copy.deepcopy(index.documents[int(doc_id)])
+
+    def generation(self, index_name: str) -> str:
+        return self.__index(index_name).name
+
+    def index_data(self, index_name: str, file_path: str, fingerprint: str = None, progress=None):
+        start = time.perf_counter()
+        documents = list(iter_items(file_path))
+        suggestions = None
+        if index_name == ALIAS_RECIPES:
+            # the inputs of the completion field are not kept in the documents, like in ElasticSearch
+            for doc in documents:
+                doc.pop("suggest", None)
+            suggestions = PrefixIndex(popularity(doc.get("name") for doc in documents))
+        # named like the versions of ElasticSearch, the name is the generation of the index
+        version = f"{index_name}{VERSION_SEPARATOR}{int(time.time() * 1000)}"
+        index = BM25Index(version, documents, TEXT_FIELDS.get(index_name, ("name",)))
+        with self.__lock:
+            self.__indices[index_name] = index
+            if suggestions is not None:
+                self.__suggestions[index_name] = suggestions
+        print(f"Data indexing completed: {len(documents)} documents in {time.perf_counter() - start:.1f}s "
+              f"in the embedded index {version}")
+        if progress is not None:
+            progress(len(documents))
+        for listener in self.listeners:
+            listener(index_name, version)
+        return len(documents), 0
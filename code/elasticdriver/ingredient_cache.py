@@ -0,0 +1,161 @@
+# Copyright (c) 2023 Anthony Gugler, Florian Hofmann and Jérémy Jordan
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+File containing the cache of the prices found for the ingredients.
+The entries are kept in memory (least recently used first out, with a time to live) and optionally in a
+SQLite file shared by the workers of the API. Each entry belongs to a generation of the index, the version
+behind its alias, so publishing a new version makes the previous entries unreachable.
+"""
+
+__authors__ = "Anthony Gugler, Florian Hofmann, Jérémy Jordan"
+__date__ = "18.10.2026"
+
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# number of entries kept in memory
+CACHE_SIZE = 10000
+# time to live of an entry in seconds
+CACHE_TTL = 3600
+# time during which the generation of an index is trusted before checking it again, in seconds
+GENERATION_TTL = 10
+
+
+class IngredientCache:
+
+    def __init__(self, max_size: int = CACHE_SIZE, ttl: float = CACHE_TTL, path: str = None):
+        """
+        Constructor
+        @param max_size: number of entries kept in memory
+        @param ttl: time to live of an entry in seconds
+        @param path: path to the SQLite file of the shared tier, None to keep the cache in memory only
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.__entries: OrderedDict = OrderedDict()
+        self.__lock = threading.Lock()
+        # generation of each index and the time it has been checked
+        self.__generations: dict = {}
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self.__db = None
+        if path is not None:
+            self.__db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            self.__db.execute("PRAGMA journal_mode=WAL")
+            self.__db.execute("CREATE TABLE IF NOT EXISTS ingredient_cache (generation TEXT, name TEXT, value TEXT, "
+                              "expires REAL, PRIMARY KEY (generation, name))")
+
+    def get(self, generation: str, name: str):
+        """
+        Give the matches of an ingredient
+        @param generation: generation of the index
+        @param name: name of the ingredient
+        @return: a new copy of the matches, None if they are not in the cache
+        """
+        key = (generation, name)
+        now = time.time()
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is not None and entry[0] > now:
+                self.__entries.move_to_end(key)
+                self.hits += 1
+                return json.loads(entry[1])
+            if entry is not None:
+                del self.__entries[key]
+            if self.__db is not None:
+                row = self.__db.execute("SELECT value, expires FROM ingredient_cache WHERE generation = ? AND name = ?",
+                                        key).fetchone()
+                if row is not None and row[1] > now:
+                    self.__store(key, row[0], row[1])
+                    self.disk_hits += 1
+                    return json.loads(row[0])
+            self.misses += 1
+            return None
+
+    def put(self, generation: str, name: str, value) -> None:
+        """
+        Add the matches of an ingredient
+        @param generation: generation of the index
+        @param name: name of the ingredient
+        @param value: the matches, they must be serializable in JSON
+        """
+        key = (generation, name)
+        encoded = json.dumps(value, ensure_ascii=False)
+        expires = time.time() + self.ttl
+        with self.__lock:
+            self.__store(key, encoded, expires)
+            if self.__db is not None:
+                self.__db.execute("INSERT OR REPLACE INTO ingredient_cache VALUES (?, ?, ?, ?)", (*key, encoded, expires))
+
+    def __store(self, key: tuple, encoded: str, expires: float) -> None:
+        self.__entries[key] = (expires, encoded)
+        self.__entries.move_to_end(key)
+        while len(self.__entries) > self.max_size:
+            self.__entries.popitem(last=False)
+
+    def generation(self, index_name: str):
+        """
+        Give the generation of an index if it has been checked recently
+        @param index_name: name of the index (or of its alias)
+        @return: the generation, None if it has to be checked again
+        """
+        entry = self.__generations.get(index_name)
+        if entry is None or time.time() - entry[1] > GENERATION_TTL:
+            return None
+        return entry[0]
+
+    def set_generation(self, index_name: str, generation: str) -> None:
+        """
+        Set the current generation of an index, the entries of the previous generations are dropped
+        @param index_name: name of the index (or of its alias)
+        @param generation: the generation, like the name of the version behind the alias
+        """
+        with self.__lock:
+            previous = self.__generations.get(index_name)
+            self.__generations[index_name] = (generation, time.time())
+            if previous is None or previous[0] == generation:
+                return
+            current = {entry[0] for entry in self.__generations.values()}
+            for key in [key for key in self.__entries if key[0] not in current]:
+                del self.__entries[key]
+            if self.__db is not None:
+                marks = ",".join("?" * len(current))
+                self.__db.execute(f"DELETE FROM ingredient_cache WHERE generation NOT IN ({marks})", tuple(current))
+
+    def stats(self) -> dict:
+        """
+        Give the counters of the cache
+        @return: dict with the number of hits (in memory and on disk), of misses and of entries in memory
+        """
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_ratio": (self.hits + self.disk_hits) / lookups if lookups > 0 else 0.0,
+            "size": len(self.__entries),
+            "generations": {index_name: entry[0] for index_name, entry in self.__generations.items()},
+        }
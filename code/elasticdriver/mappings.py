@@ -0,0 +1,115 @@
+# Copyright (c) 2023 Anthony Gugler, Florian Hofmann and Jérémy Jordan
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+File containing the index templates of the items and the recipes.
+The names are analyzed as French text (elisions like "l'huile", accents folded), the fields only used
+to filter are keywords and the fields only displayed are kept in the source without being indexed.
+"""
+
+__authors__ = "Anthony Gugler, Florian Hofmann, Jérémy Jordan"
+__date__ = "18.10.2026"
+
+# analyzer of the French names of the ingredients, the items and the recipes
+ANALYSIS = {
+    "filter": {
+        "french_elision": {
+            "type": "elision",
+            "articles_case": True,
+            "articles": ["l", "m", "t", "qu", "n", "s", "j", "d", "c", "jusqu", "quoiqu", "lorsqu", "puisqu"],
+        },
+        "french_stop": {"type": "stop", "stopwords": "_french_"},
+        "french_stemmer": {"type": "stemmer", "language": "light_french"},
+    },
+    "analyzer": {
+        "french_name": {
+            "tokenizer": "standard",
+            "filter": ["french_elision", "lowercase", "asciifolding", "french_stop", "french_stemmer"],
+        },
+        # the completion keeps every word, a prefix has to be completed as it is typed
+        "suggest_name": {
+            "tokenizer": "standard",
+            "filter": ["lowercase", "asciifolding"],
+        },
+    },
+}
+
+FRENCH_TEXT = {"type": "text", "analyzer": "french_name"}
+# prices are stored as integers of cents
+PRICE = {"type": "scaled_float", "scaling_factor": 100}
+DISPLAY_ONLY = {"type": "keyword", "index": False, "doc_values": False}
+# objects kept in the source only, their fields are not mapped
+STORED_ONLY = {"type": "object", "enabled": False}
+
+MAPPINGS_ITEMS = {
+    "properties": {
+        "source": {"type": "keyword"},
+        "name": FRENCH_TEXT,
+        "price": PRICE,
+        "price_kg": PRICE,
+        "ingredient": FRENCH_TEXT,
+        "other_ingredients": FRENCH_TEXT,
+        "link": DISPLAY_ONLY,
+    },
+}
+
+MAPPINGS_RECIPES = {
+    # the inputs of the completion are only indexed, the responses don't carry them
+    "_source": {"excludes": ["suggest"]},
+    "properties": {
+        "name": FRENCH_TEXT,
+        "category": {"type": "keyword"},
+        "price_range": {"type": "keyword"},
+        "servings_quantity": DISPLAY_ONLY,
+        "url": DISPLAY_ONLY,
+        "ingredients": {
+            "properties": {
+                "name": FRENCH_TEXT,
+                "quantity": DISPLAY_ONLY,
+                # response materialized at the indexing
+                "quantity_kg": {"type": "float", "index": False, "doc_values": False},
+                "match": STORED_ONLY,
+                "others": STORED_ONLY,
+            },
+        },
+        "ALDI_cluster": {"type": "byte"},
+        "UPS_cluster": {"type": "byte"},
+        "total_price": PRICE,
+        "price_generation": {"type": "keyword"},
+        "suggest": {"type": "completion", "analyzer": "suggest_name", "max_input_length": 100},
+    },
+}
+
+
+def index_template(index_pattern: str, mappings: dict) -> dict:
+    """
+    Build the index template applied to the versions of an index
+    @param index_pattern: pattern of the names of the versions
+    @param mappings: mappings of the index
+    @return: the parameters of the template
+    """
+    return {
+        "index_patterns": [index_pattern],
+        "priority": 100,
+        "template": {
+            "settings": {"index": {"number_of_shards": 1}, "analysis": ANALYSIS},
+            "mappings": mappings,
+        },
+    }
@@ -26,16 +26,33 @@ __authors__ = "Anthony Gugler, Florian Hofmann, Jérémy Jordan"
 __date__ = "26.05.2023"
 
 from elasticsearch import Elasticsearch
-from elasticsearch.exceptions import NotFoundError
+from dataprocessing.jsonstream import read_records, write_records
+from dataprocessing.quantity import quantity_kg
+from elasticdriver.backend import ElasticsearchBackend, SearchBackend
+from elasticdriver.elastic import ALIAS_ITEMS, ALIAS_RECIPES
+from elasticdriver.embedded import completion_field, popularity
+from elasticdriver.ingredient_cache import IngredientCache
+import copy
+import itertools
+import math
 import warnings
 
 warnings.filterwarnings("ignore", category=DeprecationWarning)
 
+# number of recipes whose ingredients are searched together when the responses are materialized
+MATERIALIZE_BATCH = 200
+# fields of the items left out of the materialized responses, an item can be affiliated to hundreds of names
+MATERIALIZED_EXCLUDES = ('other_ingredients',)
+
 
 class PriceAnalysis:
-    def __init__(self, host='localhost', port=9200, scheme='http', user: str = 'user', password: str = 'password'):
-        self.elastic = Elasticsearch(hosts=[{'host': host, 'port': port, 'scheme': scheme}],
-                                     basic_auth=(user, password))
+    def __init__(self, host='localhost', port=9200, scheme='http', user: str = 'user', password: str = 'password',
+                 client: Elasticsearch = None, cache: IngredientCache = None, backend: SearchBackend = None):
+        if backend is None:
+            backend = ElasticsearchBackend(client, host=host, port=port, scheme=scheme, user=user, password=password)
+        self.backend = backend
+        # matches of the ingredients already looked up
+        self.cache = cache if cache is not None else IngredientCache()
 
     def get_price_from_ingredient(self, ingredient_name, index_name):
         """
@@ -44,106 +61,239 @@ class PriceAnalysis:
         :param index_name: string
         :return: List of Dicts
         """
-        # Prepare the search query
-        query = {
-            "query": {
-                "bool": {
-                    "should": [
-                        {"match": {"ingredient": ingredient_name}},
-                        {"match": {"other_ingredients": ingredient_name}}
-                    ]
-                }
-            }
-        }
-
-        res = self.elastic.search(index=index_name, body=query)
-
-        # If no match found, return empty list
-        if res['hits']['total']['value'] == 0:
-            return []
-
-        # Return all matches
-        return [hit['_source'] for hit in res['hits']['hits']]
+        # If no match found, the list is empty
+        return self.backend.search_items(ingredient_name, index_name)
 
     def get_price_from_ingredient_aldi(self, ingredient_name, index_name):
         """
         Get the price of the ingredient from the elastic search index only from aldi
         :param ingredient_name: string
         :param index_name: string
-        :return: List of Dicts
+        :return: List of Dicts, None when the search failed
         """
-        # Prepare the search query
-        query = {
-            "query": {
-                "bool": {
-                    "must": [
-                        {"match": {"source": "ALDI"}}
-                    ],
-                    "should": [
-                        {"match": {"name": ingredient_name}},
-                        {"match": {"ingredient": ingredient_name}},
-                    ]
-                }
-            }
-        }
+        return self.get_ingredient_matches([ingredient_name], index_name)[0]
 
-        res = self.elastic.search(index=index_name, body=query)
+    def current_generation(self, index_name):
+        """
+        Get the generation of an index, the version behind its alias, checked again from time to time
+        :param index_name: string
+        :return: string
+        """
+        generation = self.cache.generation(index_name)
+        if generation is None:
+            generation = self.backend.generation(index_name)
+            self.cache.set_generation(index_name, generation)
+        return generation
 
-        # If no match found, return empty list
-        if res['hits']['total']['value'] == 0:
-            return [[], []]
+    def get_ingredient_matches(self, names, price_index):
+        """
+        Get the best match and all the matches of each ingredient, from the cache or in one search of the backend
+        :param names: List of the ingredient names
+        :param price_index: string
+        :return: List of the matches of each ingredient, in the same order, None for the ingredients whose
+        search failed
+        """
+        generation = self.current_generation(price_index)
+        matches, missing = self.cached_matches(self.cache, generation, names)
+        if len(missing) > 0:
+            self.merge_matches(self.cache, generation, names, matches, missing,
+                               self.backend.search_ingredients(missing, price_index))
+        return matches
 
-        # Return best match and all other matches
-        return [res['hits']['hits'][0]['_source'], res['hits']['hits']]
+    @staticmethod
+    def cached_matches(cache, generation, names):
+        """
+        Get the matches of the ingredients from the cache
+        :param cache: IngredientCache
+        :param generation: string, generation of the price index
+        :param names: List of the ingredient names
+        :return: List of the matches (None when they are not in the cache) and List of the distinct names missing
+        """
+        matches = [cache.get(generation, name) for name in names]
+        missing = list(dict.fromkeys(name for name, match in zip(names, matches) if match is None))
+        return matches, missing
 
     @staticmethod
-    def parse_recipe_quantity(quantity_str: str) -> float:
+    def merge_matches(cache, generation, names, matches, missing, results):
         """
-        Method to parse the quantity of a recipe ingredient into a kg quantity
-        If return is , it mean that is an invariant and always purchase one time the product
+        Complete the matches with the results of the searches of the missing ingredients and cache them,
+        the matches of the ingredients whose search failed stay None
+        :param cache: IngredientCache
+        :param generation: string, generation of the price index
+        :param names: List of the ingredient names
+        :param matches: List of the matches, completed in place
+        :param missing: List of the distinct names searched
+        :param results: List of the matches found by the backend, in the same order as missing
+        :return: List of the names whose search failed
+        """
+        found = {}
+        failed = []
+        for name, result in zip(missing, results):
+            # a failed search is not cached
+            if result is None:
+                failed.append(name)
+                continue
+            found[name] = result
+            cache.put(generation, name, result)
+        for i, name in enumerate(names):
+            if matches[i] is None and name in found:
+                # each ingredient gets its own copy, the response is modified
+                matches[i] = copy.deepcopy(found[name])
+        return failed
+
+    @classmethod
+    def build_recipe_response(cls, recipe, matches):
+        """
+        Add to each ingredient of a recipe its best match, the other matches and the quantities
+        :param recipe: Dict, the recipe found
+        :param matches: List of the best match and all the matches of each ingredient, in the same order,
+        None when the search of the ingredient failed
+        :return: Dict, the recipe, its ingredients whose search failed are marked with match_failed
         """
+        for ingredient, match in zip(recipe['ingredients'], matches):
+            if match is None:
+                # the price is unknown, not zero, the response must not be taken for a complete one
+                ingredient['match_failed'] = True
+                continue
+            prices, others = match
+            if len(prices) == 0 and len(others) == 0:
+                continue
+            # keep 6 first results and add them to the return object
+            others = others[:6]
+            tmp: list = []
+            for o in others:
+                # check to have only Aldi results
+                if o['_source']['source'] != 'ALDI':
+                    continue
+                # compute quantity price with price per kg
+                o['_source']['quantity'] = cls.item_quantity(prices)
+                tmp.append(o['_source'])
+            ingredient['others'] = tmp
+            # add to the return object
+            ingredient['quantity_kg'] = cls.parse_recipe_quantity(ingredient['quantity'])
+            ingredient['match'] = prices
+            ingredient['match']['quantity'] = cls.item_quantity(prices)
+        recipe['total_price'] = cls.recipe_total(recipe)
+        return recipe
 
-        PIECE_KG = 0.2  # Weigh to use when the quantity is in piece on there is no unit
+    @staticmethod
+    def failed_lookup(recipe):
+        """
+        Tell if the search of an ingredient failed while the response of a recipe was built
+        :param recipe: Dict, the response
+        :return: bool
+        """
+        return any(ingredient.get('match_failed', False) for ingredient in recipe['ingredients'])
 
-        quantity_str = quantity_str.lower()
-        quantity_str = quantity_str.strip()
-        if quantity_str == "":
+    @staticmethod
+    def item_quantity(item):
+        """
+        Compute the quantity of an item from its price per kg
+        :param item: Dict, the item matched
+        :return: float, the quantity in kg, 0 when it is unknown (sold by piece or no price per kg)
+        """
+        if item['price_kg'] <= 0:
             return 0
-        # split one time the quantity string
-        quantity_list = quantity_str.split(' ', 1)
-
-        # check if there is a unit in the quantity string
-        if len(quantity_list) == 1:
-            return float(quantity_list[0]) * PIECE_KG
-
-        # convert frational string to float
-        if '/' in quantity_list[0]:
-            fraction = quantity_list[0].split('/')
-            quantity_list[0] = float(fraction[0]) / float(fraction[1])
-            print(quantity_list[0])
-
-        if quantity_list[1] == 'g':
-            return float(quantity_list[0]) / 1000
-        elif quantity_list[1] == 'kg':
-            return float(quantity_list[0])
-        elif quantity_list[1] == 'l':
-            print(float(quantity_list[0]) * 1.03)
-            return float(quantity_list[0]) * 1.03
-        elif quantity_list[1] == 'cl':
-            return float(quantity_list[0]) * 0.01
-        elif quantity_list[1] == 'ml':
-            return float(quantity_list[0]) * 0.001
-        elif quantity_list[1] == 'verres':
-            return float(quantity_list[0]) * 0.2
-        elif quantity_list[1] == 'petite tasse':
-            return float(quantity_list[0]) * 0.1
-        elif quantity_list[1] == 'cuillère':
-            return float(quantity_list[0]) * 0.005
-        else:
-            return 0  # consider as invariant
+        return item['price'] / item['price_kg']
 
+    @staticmethod
+    def recipe_total(recipe):
+        """
+        Compute the price of a recipe, each item matched is bought as many times as needed for the quantity
+        :param recipe: Dict, the recipe with the matches of its ingredients
+        :return: float
+        """
+        total = 0
+        for ingredient in recipe['ingredients']:
+            if 'match' not in ingredient:
+                continue
+            match = ingredient['match']
+            # a quantity of 0 is an invariant and an unknown item quantity is a piece, the item is bought once
+            pieces = 1
+            if ingredient['quantity_kg'] != 0 and match['quantity'] > 0:
+                pieces = math.ceil(ingredient['quantity_kg'] / match['quantity'])
+            total += match['price'] * pieces
+        return round(total, 2)
 
+    @staticmethod
+    def strip_materialized(recipe):
+        """
+        Remove from a recipe the response materialized at its indexing
+        :param recipe: Dict
+        :return: Dict, the recipe as it has been scraped
+        """
+        recipe.pop('total_price', None)
+        recipe.pop('price_generation', None)
+        for ingredient in recipe['ingredients']:
+            for key in ('match', 'others', 'quantity_kg', 'match_failed'):
+                ingredient.pop(key, None)
+        return recipe
 
+    def materialize_recipes(self, recipes_path, output_path, price_index=ALIAS_ITEMS, batch_size=MATERIALIZE_BATCH):
+        """
+        Compute the response of every recipe with the current items and write the recipes with their response,
+        the generation of the items is kept to know when the response is out of date.
+        The first recipe of each name also gets the inputs completing its name, weighted by its popularity
+        :param recipes_path: string, path to the recipes
+        :param output_path: string, path to the recipes with their response (JSON Lines)
+        :param price_index: string
+        :param batch_size: int, number of recipes whose ingredients are searched together
+        :return: int, number of recipes written
+        """
+        generation = self.current_generation(price_index)
+        weights = popularity(recipe['name'] for recipe in read_records(recipes_path))
+
+        def materialized():
+            recipes = read_records(recipes_path)
+            while True:
+                batch = list(itertools.islice(recipes, batch_size))
+                if len(batch) == 0:
+                    return
+                names = [ingredient['name'] for recipe in batch for ingredient in recipe['ingredients']]
+                matches = iter(self.get_ingredient_matches(names, price_index))
+                for recipe in batch:
+                    self.strip_materialized(recipe)
+                    recipe_matches = [next(matches) for _ in recipe['ingredients']]
+                    try:
+                        self.build_recipe_response(recipe, recipe_matches)
+                        if self.failed_lookup(recipe):
+                            # a response missing some prices is not kept, the recipe is priced when it is queried
+                            print(f"Failed to search the ingredients of the recipe {recipe.get('name')}")
+                            self.strip_materialized(recipe)
+                        else:
+                            for ingredient in recipe['ingredients']:
+                                if 'match' in ingredient:
+                                    ingredient['match'] = self.without_excludes(ingredient['match'])
+                                    ingredient['others'] = [self.without_excludes(o) for o in ingredient['others']]
+                            recipe['price_generation'] = generation
+                    except Exception as e:
+                        # without its generation the recipe is priced when it is queried, the others are indexed
+                        print(f"Failed to materialize the response of the recipe {recipe.get('name')}: {e!r}")
+                        self.strip_materialized(recipe)
+                    if recipe['name'] in weights:
+                        recipe['suggest'] = completion_field(recipe['name'], weights.pop(recipe['name']))
+                    yield recipe
+
+        count = write_records(output_path, materialized(), jsonl=True)
+        print(f"Materialized the responses of {count} recipes with {generation}")
+        return count
+
+    @staticmethod
+    def without_excludes(item):
+        """
+        Copy an item without the fields left out of the materialized responses
+        :param item: Dict
+        :return: Dict
+        """
+        return {key: value for key, value in item.items() if key not in MATERIALIZED_EXCLUDES}
+
+    @staticmethod
+    def parse_recipe_quantity(quantity_str: str) -> float:
+        """
+        Method to parse the quantity of a recipe ingredient into a kg quantity
+        If return is 0, it mean that is an invariant and always purchase one time the product
+        """
+        return quantity_kg(quantity_str)
 
     @staticmethod
     def get_price_by_quantity(quantity_str, price):
@@ -153,17 +303,7 @@ class PriceAnalysis:
         :param price: Dict
         :return: float
         """
-        quantity_str = quantity_str.lower()
-        quantity = 0
-
-        if 'g' in quantity_str:  # grams
-            quantity = float(quantity_str.split()[0]) / 1000
-        elif 'verres' in quantity_str:  # glasses
-            quantity = float(quantity_str.split()[0]) * 0.2
-        elif 'petite tasse' in quantity_str:  # small cup
-            quantity = float(quantity_str.split()[0]) * 0.1
-        elif quantity_str.isdigit():  # plain number
-            quantity = float(quantity_str)
+        quantity = quantity_kg(quantity_str)
 
         if 'price_kg' in price:
             return quantity * price['price_kg']
@@ -172,11 +312,10 @@ class PriceAnalysis:
         else:
             return 0
 
-    def get_price_for_recipe(self, recipe_id, recipe_index='recipe_marmiton', price_index='items_ingredient'):
+    def get_price_for_recipe(self, recipe_id, recipe_index=ALIAS_RECIPES, price_index=ALIAS_ITEMS):
         # Get the recipe from the elastic search
-        try:
-            recipe = self.elastic.get(index=recipe_index, id=recipe_id)['_source']
-        except NotFoundError:
+        recipe = self.backend.get_document(recipe_index, recipe_id)
+        if recipe is None:
             print(f'Recipe with ID {recipe_id} not found in the {recipe_index} index.')
             return
 
@@ -235,45 +374,18 @@ class PriceAnalysis:
         for key, value in total_cost_usp.items():
             print(f'{key}: {value}')
 
-    def query_recipe(self, query: str, recipe_index: str = 'recipe_marmiton', price_index='items_ingredient'):
-        # prepare the search query
-        query = {
-            "query": {
-                "match": {
-                    "name": query
-                }
-            }
-        }
-        # get the recipe from the elastic search
-        res = self.elastic.search(index=recipe_index, body=query)
-        # keep the best match
-        best_match = res['hits']['hits'][0]['_source'] if res['hits']['total']['value'] > 0 else None
-        # query each ingredient and keep the best match
-        for i in range(len(best_match['ingredients'])):
-            prices, others = self.get_price_from_ingredient_aldi(best_match['ingredients'][i]['name'], price_index)
-            if len(prices) == 0 and len(others) == 0:
-                continue
-            # keep 6 first results and add them to the return object
-            others = others[:6]
-            tmp: list = []
-            for o in others:
-                # check to have only Aldi results
-                if o['_source']['source'] != 'ALDI':
-                    continue
-                # compute quantity price with price per kg
-                item_quantity = prices['price'] / prices['price_kg']
-                o['_source']['quantity'] = item_quantity
-                tmp.append(o['_source'])
-            best_match['ingredients'][i]['others'] = tmp
-            # compute quantity price with price per kg
-            item_quantity = prices['price']/prices['price_kg']
-            # add to the return object
-            best_match['ingredients'][i]['quantity_kg'] = self.parse_recipe_quantity(best_match['ingredients'][i]['quantity'])
-            best_match['ingredients'][i]['match'] = prices
-            best_match['ingredients'][i]['match']['quantity'] = item_quantity
-
-
-        return best_match
+    def query_recipe(self, query: str, recipe_index: str = ALIAS_RECIPES, price_index=ALIAS_ITEMS):
+        # get the best match of the recipe from the search backend
+        best_match = self.backend.search_recipe(query, recipe_index)
+        if best_match is None or len(best_match['ingredients']) == 0:
+            return best_match
+        # the response materialized at the indexing is used while the items are the same
+        if best_match.get('price_generation') == self.current_generation(price_index):
+            return best_match
+        self.strip_materialized(best_match)
+        # query all the ingredients at once and keep the best match of each
+        names = [ingredient['name'] for ingredient in best_match['ingredients']]
+        return self.build_recipe_response(best_match, self.get_ingredient_matches(names, price_index))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,140 @@
+# Copyright (c) 2023 Anthony Gugler, Florian Hofmann and Jérémy Jordan
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+File containing the cache of the responses of the API.
+The responses are kept encoded with their ETag, for a normalized query and the generation of the data,
+the timestamp of the last scraping and the versions of the indices. A new scraping or a new version of an
+index changes the generation, so the keys and the ETags.
+"""
+
+__authors__ = "Anthony Gugler, Florian Hofmann, Jérémy Jordan"
+__date__ = "18.10.2026"
+
+import hashlib
+import os
+import threading
+import unicodedata
+from collections import OrderedDict
+
+# number of responses kept
+RESPONSE_CACHE_SIZE = 2000
+# file written at the end of each scraping
+PATH_TIMESTAMP = "last_action_timestamp.txt"
+
+
+def normalize_query(query: str) -> str:
+    """
+    Normalize a query so the variants searched the same way share their response
+    @param query: the query of the user
+    @return: the query in lower case, with its accents composed and its spaces collapsed
+    """
+    return " ".join(unicodedata.normalize("NFC", query).lower().split())
+
+
+class ResponseCache:
+
+    def __init__(self, max_size: int = RESPONSE_CACHE_SIZE, path_timestamp: str = PATH_TIMESTAMP):
+        """
+        Constructor
+        @param max_size: number of responses kept
+        @param path_timestamp: path to the timestamp of the last scraping
+        """
+        self.max_size = max_size
+        self.path_timestamp = path_timestamp
+        self.__entries: OrderedDict = OrderedDict()
+        self.__lock = threading.Lock()
+        # generation read from the timestamp file and the modification time of the file
+        self.__generation = "0"
+        self.__mtime = None
+        # versions of the indices loaded since the start, joined in a string added to the generation
+        self.__versions: dict = {}
+        self.__versions_key = ""
+
+    def generation(self) -> str:
+        """
+        Give the generation of the data, the file is only read again when it has been modified
+        @return: the timestamp of the last scraping ("0" if there is none) and the versions of the indices
+        """
+        try:
+            mtime = os.stat(self.path_timestamp).st_mtime_ns
+        except FileNotFoundError:
+            return "0" + self.__versions_key
+        if mtime != self.__mtime:
+            with open(self.path_timestamp, "r") as f:
+                self.__generation = f.read().strip() or "0"
+            self.__mtime = mtime
+        return self.__generation + self.__versions_key
+
+    def set_version(self, index_name: str, version: str) -> None:
+        """
+        Change the version of an index, listener of the search backend. The responses built from the previous
+        version can't be reached anymore and are removed
+        @param index_name: name of the index
+        @param version: its new version
+        """
+        with self.__lock:
+            self.__versions[index_name] = version
+            self.__versions_key = "".join(f":{name}={v}" for name, v in sorted(self.__versions.items()))
+            self.__entries.clear()
+
+    def get(self, key: tuple):
+        """
+        Give a response
+        @param key: the route, the normalized query and the generation
+        @return: tuple with the ETag and the encoded body, None if the response is not in the cache
+        """
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is not None:
+                self.__entries.move_to_end(key)
+            return entry
+
+    def put(self, key: tuple, body: bytes) -> str:
+        """
+        Add a response
+        @param key: the route, the normalized query and the generation
+        @param body: the encoded body
+        @return: the ETag of the response
+        """
+        etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+        with self.__lock:
+            self.__entries[key] = (etag, body)
+            self.__entries.move_to_end(key)
+            while len(self.__entries) > self.max_size:
+                self.__entries.popitem(last=False)
+        return etag
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """
+    Check the header If-None-Match of a conditional request
+    @param if_none_match: value of the header, None if there is none
+    @param etag: the ETag of the current response
+    @return: True if the client already has the current response
+    """
+    if if_none_match is None:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        # the weak comparison is used for If-None-Match
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
@@ -0,0 +1,55 @@
+# Copyright (c) 2023 Anthony Gugler, Florian Hofmann and Jérémy Jordan
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+"""
+Tests of the Aho-Corasick automaton against a search of every pattern in the text
+"""
+
+__authors__ = "Anthony Gugler, Florian Hofmann, Jérémy Jordan"
+__date__ = "18.10.2026"
+
+import random
+
+import pytest
+
+from dataprocessing.automaton import AhoCorasick
+
+
+def brute_force(patterns: list, text: str) -> set:
+    # a pattern given several times is found with its first index
+    return {patterns.index(pattern) for pattern in patterns if pattern != "" and pattern in text}
+
+
+@pytest.mark.parametrize("seed", range(50))
+def test_search_random(seed):
+    rng = random.Random(seed)
+    alphabet = "abé "
+    patterns = ["".join(rng.choice(alphabet) for _ in range(rng.randint(0, 4))) for _ in range(rng.randint(1, 12))]
+    automaton = AhoCorasick(patterns)
+    for _ in range(20):
+        text = "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 15)))
+        assert automaton.search(text) == brute_force(patterns, text)
+
+
+def test_search_ingredients():
+    patterns = ["carotte", "carotte rapée", "rapée", "pomme", "pomme de terre"]
+    automaton = AhoCorasick(patterns)
+    assert automaton.search("salade de carotte rapée") == {0, 1, 2}
+    assert automaton.search("pommes de terre") == {3}
+    assert automaton.search("poireau") == set()
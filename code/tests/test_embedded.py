@@ -0,0 +1,144 @@
+# Copyright (c) 2023 Anthony Gugler, Florian Hofmann and Jérémy Jordan
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+"""
+Tests of the embedded search backend on a small catalogue, the responses must have the shape of the ones
+of ElasticSearch used by the price analysis
+"""
+
+__authors__ = "Anthony Gugler, Florian Hofmann, Jérémy Jordan"
+__date__ = "18.10.2026"
+
+import json
+
+import pytest
+
+from elasticdriver.backend import best_and_others
+from elasticdriver.elastic import ALIAS_ITEMS, ALIAS_RECIPES
+from elasticdriver.embedded import TEXT_FIELDS, BM25Index, EmbeddedBackend
+from elasticdriver.price_analysis import PriceAnalysis
+
+ITEMS = [
+    {"source": "ALDI", "name": "Pommes Golden", "price_kg": 2.5, "price": 2.5, "ingredient": "pomme",
+     "link": "https://www.aldi.ch/pommes", "other_ingredients": ["pomme golden"]},
+    {"source": "ALDI", "name": "Beurre de cuisine", "price_kg": 10.0, "price": 2.5, "ingredient": "beurre",
+     "link": "https://www.aldi.ch/beurre", "other_ingredients": []},
+    {"source": "USP", "name": "Beurre", "price_kg": 12.0, "price": 3.0, "ingredient": "beurre",
+     "other_ingredients": []},
+    {"source": "ALDI", "name": "Oeufs frais", "price_kg": -1, "price": 4.2, "ingredient": "oeuf",
+     "link": "https://www.aldi.ch/oeufs", "other_ingredients": []},
+]
+RECIPES = [
+    {"name": "Tarte aux pommes", "ingredients": [{"name": "pomme", "quantity": "500 g"},
+                                                 {"name": "beurre", "quantity": "100 g"},
+                                                 {"name": "cannelle", "quantity": "1 pincée"}]},
+    {"name": "Omelette", "ingredients": [{"name": "oeuf", "quantity": "3"}]},
+]
+
+
+@pytest.fixture
+def backend(tmp_path):
+    items_path = tmp_path / "items_ingredient.json"
+    items_path.write_text(json.dumps(ITEMS), encoding="utf8")
+    recipes_path = tmp_path / "recipe_marmiton.json"
+    recipes_path.write_text(json.dumps(RECIPES), encoding="utf8")
+    backend = EmbeddedBackend()
+    backend.index_data(ALIAS_ITEMS, str(items_path))
+    backend.index_data(ALIAS_RECIPES, str(recipes_path))
+    return backend
+
+
+@pytest.fixture
+def items_index():
+    return BM25Index("items", ITEMS, TEXT_FIELDS[ALIAS_ITEMS])
+
+
+def test_search_recipe(backend):
+    assert backend.search_recipe("tarte pommes", ALIAS_RECIPES)["name"] == "Tarte aux pommes"
+    assert backend.search_recipe("gratin", ALIAS_RECIPES) is None
+
+
+def test_filter_without_matching_terms(items_index):
+    res = items_index.search([("name", "cannelle"), ("ingredient", "cannelle")], filters={"source": "ALDI"})
+    hits = res["hits"]["hits"]
+    # the should clauses are optional with a filter, every document filtered matches with a score of 0
+    assert res["hits"]["total"]["value"] == 3
+    assert [hit["_source"]["name"] for hit in hits] == ["Pommes Golden", "Beurre de cuisine", "Oeufs frais"]
+    assert all(hit["_score"] == 0 for hit in hits)
+
+
+def test_total_with_filter(items_index):
+    res = items_index.search([("name", "beurre"), ("ingredient", "beurre")], filters={"source": "ALDI"}, size=2)
+    hits = res["hits"]["hits"]
+    assert res["hits"]["total"] == {"value": 3, "relation": "eq"}
+    assert len(hits) == 2
+    assert hits[0]["_source"]["name"] == "Beurre de cuisine"
+    assert hits[0]["_score"] > 0 and hits[1]["_score"] == 0
+    # without a filter only the documents matching a term are counted
+    assert items_index.search([("name", "beurre")])["hits"]["total"]["value"] == 2
+
+
+def test_best_and_others():
+    assert best_and_others({"hits": {"total": {"value": 0, "relation": "eq"}, "hits": []}}) == [[], []]
+    assert best_and_others({"error": {"type": "search_phase_execution_exception"}, "status": 400}) is None
+    hit = {"_index": "items", "_id": "0", "_score": 1.0, "_source": {"name": "Beurre"}}
+    assert best_and_others({"hits": {"total": {"value": 1, "relation": "eq"}, "hits": [hit]}}) == [{"name": "Beurre"}, [hit]]
+
+
+def test_get_price_from_ingredient_aldi(backend):
+    best, others = PriceAnalysis(backend=backend).get_price_from_ingredient_aldi("beurre", ALIAS_ITEMS)
+    assert best["name"] == "Beurre de cuisine"
+    assert best["source"] == "ALDI"
+    assert others[0]["_source"] == best
+    assert set(others[0]) == {"_index", "_id", "_score", "_source"}
+    assert all(hit["_source"]["source"] == "ALDI" for hit in others)
+
+
+def test_query_recipe(backend):
+    recipe = PriceAnalysis(backend=backend).query_recipe("tarte aux pommes")
+    apple, butter, cinnamon = recipe["ingredients"]
+    assert apple["match"]["name"] == "Pommes Golden"
+    assert apple["quantity_kg"] == 0.5
+    assert apple["match"]["quantity"] == 1.0
+    assert butter["match"]["name"] == "Beurre de cuisine"
+    assert butter["match"]["quantity"] == 0.25
+    assert all(other["source"] == "ALDI" and "quantity" in other for other in apple["others"])
+    # an ingredient without any term in the items still gets an item filtered, like with ElasticSearch
+    assert "match" in cinnamon
+    assert "match_failed" not in apple
+    assert recipe["total_price"] == pytest.approx(2.5 + 2.5 + cinnamon["match"]["price"])
+
+
+def test_query_recipe_sold_by_piece(backend):
+    recipe = PriceAnalysis(backend=backend).query_recipe("omelette")
+    eggs = recipe["ingredients"][0]
+    # the quantity of an item sold by piece is unknown, it is bought once
+    assert eggs["match"]["quantity"] == 0
+    assert recipe["total_price"] == 4.2
+
+
+def test_query_recipe_failed_search(backend, monkeypatch):
+    monkeypatch.setattr(backend, "search_ingredients", lambda names, price_index: [None] * len(names))
+    recipe = PriceAnalysis(backend=backend).query_recipe("omelette")
+    assert recipe["ingredients"][0]["match_failed"] is True
+    assert PriceAnalysis.failed_lookup(recipe)
+
+
+def test_query_recipe_not_found(backend):
+    assert PriceAnalysis(backend=backend).query_recipe("gratin") is None
@@ -0,0 +1,54 @@
+# Copyright (c) 2023 Anthony Gugler, Florian Hofmann and Jérémy Jordan
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+Tests of the reading of the JSON files block by block, with blocks small enough to cut the values
+"""
+
+__authors__ = "Anthony Gugler, Florian Hofmann, Jérémy Jordan"
+__date__ = "18.10.2026"
+
+import json
+
+import pytest
+
+from dataprocessing import jsonstream
+
+
+@pytest.mark.parametrize("text, chunk_size", [
+    ("[0.1]", 1),
+    ("[-2500.0 ]", 7),
+    ('[{"price": 1.25}, 3.5e2, -7, "a,b]"]', 3),
+    ('[\n  12,\n  0.75\n]', 5),
+])
+def test_read_records_numbers_cut_by_blocks(tmp_path, monkeypatch, text, chunk_size):
+    path = tmp_path / "records.json"
+    path.write_text(text, encoding="utf8")
+    monkeypatch.setattr(jsonstream, "CHUNK_SIZE", chunk_size)
+    assert list(jsonstream.read_records(str(path))) == json.loads(text)
+
+
+@pytest.mark.parametrize("chunk_size", range(1, 12))
+def test_read_items_numbers_cut_by_blocks(tmp_path, monkeypatch, chunk_size):
+    costs = {"Tarte": 12.5, "Mousse": {"ALDI": -1.0, "USP": 0.125}, "Soupe": 3}
+    path = tmp_path / "costs.json"
+    path.write_text(json.dumps(costs, indent=1), encoding="utf8")
+    monkeypatch.setattr(jsonstream, "CHUNK_SIZE", chunk_size)
+    assert dict(jsonstream.read_items(str(path))) == costs
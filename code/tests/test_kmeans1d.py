@@ -0,0 +1,71 @@
+# Copyright (c) 2023 Anthony Gugler, Florian Hofmann and Jérémy Jordan
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+"""
+Tests of the exact 1-D k-means against every assignment of small sets of values
+"""
+
+__authors__ = "Anthony Gugler, Florian Hofmann, Jérémy Jordan"
+__date__ = "18.10.2026"
+
+import itertools
+import random
+
+import numpy as np
+import pytest
+
+from dataprocessing.kmeans1d import kmeans_1d
+
+
+def inertia(values, labels) -> float:
+    values = np.asarray(values, dtype=np.float64)
+    labels = np.asarray(labels)
+    return sum(float(((values[labels == label] - values[labels == label].mean()) ** 2).sum())
+               for label in set(labels.tolist()))
+
+
+def brute_force(values, nbr_cluster: int) -> float:
+    return min(inertia(values, labels) for labels in itertools.product(range(nbr_cluster), repeat=len(values)))
+
+
+@pytest.mark.parametrize("seed", range(40))
+def test_kmeans_1d_optimal(seed):
+    rng = random.Random(seed)
+    values = [rng.choice([rng.randint(0, 5), round(rng.uniform(-10, 50), 2)]) for _ in range(rng.randint(1, 7))]
+    nbr_cluster = rng.randint(1, 4)
+    labels, clusters = kmeans_1d(values, nbr_cluster)
+    k = min(nbr_cluster, len(set(values)))
+    assert inertia(values, labels) == pytest.approx(brute_force(values, k), abs=1e-9)
+    assert len(clusters) == k
+    # the clusters are intervals numbered by increasing value
+    for label, (price_min, price_max, count) in enumerate(clusters):
+        members = [value for value, value_label in zip(values, labels) if value_label == label]
+        assert (min(members), max(members), len(members)) == (price_min, price_max, count)
+    assert all(clusters[i][1] < clusters[i + 1][0] for i in range(k - 1))
+
+
+def test_kmeans_1d_equal_values():
+    labels, clusters = kmeans_1d([3.0, 3.0, 1.0, 3.0], 3)
+    assert labels.tolist() == [1, 1, 0, 1]
+    assert clusters == [(1.0, 1.0, 1), (3.0, 3.0, 3)]
+
+
+def test_kmeans_1d_empty():
+    labels, clusters = kmeans_1d([], 3)
+    assert len(labels) == 0 and clusters == []
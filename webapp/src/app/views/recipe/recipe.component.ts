@@ -46,9 +46,10 @@ export class RecipeComponent implements OnChanges, OnInit, OnDestroy{
   }
 
   computeNumberOfPieces(ingredient: any): number{
-    // check if invariant, return 1
-    if(ingredient.quantity_kg == 0) return 1;
-    return Math.ceil(ingredient.quantity_kg / parseFloat(ingredient.match.quantity));
+    // check if invariant or if the quantity of the item is unknown, return 1
+    let itemQuantity = parseFloat(ingredient.match.quantity);
+    if(ingredient.quantity_kg == 0 || !(itemQuantity > 0)) return 1;
+    return Math.ceil(ingredient.quantity_kg / itemQuantity);
   }
 
   updateQuantityString(quantity: string, factor: number): string{